@@ -22,14 +22,21 @@ import os
 import atexit
 import gc
 import time
-
-# Related third party imports.
+import argparse
+import subprocess
+import json
+import threading
+import heapq
+import operator
+import hashlib
+import gzip
+import socket
+
+# Related third party imports.  IPython and matplotlib are imported on demand
+# (see ``prepare_img`` and ``main``), they are slow to load and a headless job
+# never needs a GUI backend or the interactive shell.
 import serial
-import IPython
-import numpy as np # remove
-import matplotlib.image as mpimg
-import matplotlib.pyplot as plt
-import matplotlib.cm as cm
+import numpy as np
 
 # Same as **printer73x**.
 __version__ = '0.09'
@@ -49,6 +56,86 @@ Welcome!
 '''
 '''Welcome message for command line interface.'''
 
+STARTUP_BENCHMARK_MODULES = (
+    'serial',
+    'numpy',
+    'matplotlib.image',
+    'matplotlib.pyplot',
+    'IPython',
+    'printerc',
+)
+'''Modules whose import time is measured by ``benchmark_startup``.'''
+
+EXIT_OK = 0
+'''Exit status of a successful command.'''
+
+EXIT_FAILURE = 1
+'''Exit status of a job that could not be prepared or printed.'''
+
+EXIT_USAGE = 2
+'''Exit status for command line usage errors.'''
+
+EXIT_NO_CONNECTION = 3
+'''Exit status when the MM12 *command port* can not be opened.'''
+
+EXIT_INTERRUPTED = 130
+'''Exit status of a job interrupted by the user.'''
+
+PROGRESS_INTERVAL = 0.5
+'''Seconds between progress updates while printing.'''
+
+DAEMON_ADDRESS = ('127.0.0.1', 7373)
+'''Default ``(host, port)`` where the print daemon listens.  The daemon only
+listens on loopback addresses, so only local connections are accepted (see
+``parse_listen_address``).'''
+
+JOG_POLL_INTERVAL = 0.01
+'''Seconds ``manual_translation_mode`` waits for keys before checking whether
+the MM12 finished the last translation.'''
+
+JOG_RELEASE_TIMEOUT = 0.6
+'''Seconds without repetitions of a key after which it is considered released,
+longer than the delay before the keyboard starts repeating a held key.'''
+
+JOG_ACCELERATION_PERIOD = 0.5
+'''Seconds a key has to be held to double the jog speed.'''
+
+JOG_MAX_SPEED = 16
+'''Largest factor of the jog speed.'''
+
+JOG_REPEAT_INTERVAL = 0.1
+'''Longest seconds between two repetitions of a held key, shorter than the
+time between two taps.  Keys received at once (typed ahead) are taps.'''
+
+JOG_FEED_PERIOD = 0.05
+'''Seconds of translation the repetitions of a held key can queue while the
+MM12 is busy, about the period a keyboard repeats a held key, so the tool
+stops shortly after the key is released.'''
+
+JOB_SETUP_TIME = 30
+'''Approximate seconds the operator takes to set up a job, placing the sheet
+and moving the tool to the HOME position.  Used to compare nested jobs with
+sequential ones (see ``plan_nested``).'''
+
+TOOLPATH_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.printerc',
+                                  'toolpaths')
+'''Default directory of the ``ToolpathCache``.'''
+
+TOOLPATH_CACHE_SIZE = 256 * 2**20
+'''Default size limit, in bytes, of the ``ToolpathCache``.'''
+
+MACHINE = 'default'
+'''Name of the machine whose profile is used (see ``tune_feed_rate``), set
+with the ``--machine`` command line option.'''
+
+MACHINE_PROFILES = os.path.join(os.path.expanduser('~'), '.printerc',
+                                'profiles.json')
+'''Path to the file with the tuned profile of each machine.'''
+
+INK_THRESHOLD = 0.9
+'''Gray level under which a pixel of the image is printed (see
+``load_img``).'''
+
 # MM12
 # ==========================================================================
 TRANSITIONS_PER_STEP = 2
@@ -131,6 +218,30 @@ SUB_STEPPER_PIXEL_TEMPLATE = '''sub {name}
 '''Template for the MM12 script subroutines that drive a stepper motor in units
 of pixels,'''
 
+SUB_STEPPER_DIAGONAL_PIXEL_TEMPLATE = '''sub {name}
+  {{{{ntransitions}}}}
+  {x_dir} {x_dir_channel} servo          # set directions
+  {y_dir} {y_dir_channel} servo
+  begin
+    dup
+    while
+    {off} {x_step_channel} servo
+    {off} {y_step_channel} servo
+    {{delay}} delay
+    {on} {x_step_channel} servo
+    {on} {y_step_channel} servo
+    {{delay}} delay
+    1 minus
+  repeat
+  quit
+'''
+'''Template for the MM12 script subroutines that drive both stepper motors at
+the same time, in units of pixels, for a diagonal translation.  Each edge
+writes both step channels, so with ``delay`` a pixel takes about 17% longer
+than a single axis pixel translation (237.7 against 277.4 transitions/s with
+1 ms).  Unrolled with a busy wait of 2 or more, the padding makes up for the
+extra writes and both take as long (see ``unroll_pulse_loop``).'''
+
 SUB_STEPPER_PULSE_TEMPLATE = '''sub {name}
   {dir} {dir_channel} servo          # set direction
   {off} {step_channel} servo
@@ -142,17 +253,92 @@ SUB_STEPPER_PULSE_TEMPLATE = '''sub {name}
 '''Template for the MM12 script subroutines that drive a stepper motor in units
 of low-to-high transitions, for a precise but slow translation.'''
 
+SUB_STEPPER_JOG_TEMPLATE = '''sub {name}
+  {dir} {dir_channel} servo          # set direction
+  begin                # transitions, the subroutine parameter.
+    dup
+    while
+    {off} {step_channel} servo
+    {{delay}} delay
+    {on} {step_channel} servo
+    {{delay}} delay
+    1 minus
+  repeat
+  quit
+'''
+'''Template for the MM12 script subroutines that drive a stepper motor as many
+low-to-high transitions as printerc passes, for the jog mode of
+``manual_translation_mode``.'''
+
 SUB_SERVO_TEMPLATE = '''sub {name}
+  {{acceleration}} {channel} acceleration
+  {{speed}} {channel} speed
   {position} {channel} servo
   begin
     get_moving_state
   while
     # wait until is is no longer moving.
   repeat
-  75 delay
+  delay                # settle time (ms), the subroutine parameter.
   quit
 '''
-'''Template for the MM12 script subroutine that drives the servo motor.'''
+'''Template for the MM12 script subroutine that drives the servo motor.  The
+settle time is passed by printerc on every call (see ``translate``).'''
+
+MM12_COMMAND_LATENCY = 0.004
+'''Approximate time, in seconds, printerc takes to send a translation to the
+MM12, including the script status query (see ``translate``).'''
+
+SERVO_FRAME = 0.01
+'''Period, in seconds, in which the MM12 updates the position of the servo
+channels according to their speed and acceleration.'''
+
+MM12_INSTRUCTION_TIME = 0.0001
+'''Approximate time, in seconds, the MM12 takes to execute a script
+instruction.  Only used by ``MM12Emulator`` and to time the unrolled pulse
+trains (see ``mm12_script``).'''
+
+MM12_SCRIPT_MEMORY = 8192
+'''Size, in bytes, of the MM12 script memory.'''
+
+DIAGONAL_RATE_TOLERANCE = 0.75
+'''Smallest ratio of the step rate of a diagonal translation to the rate
+along a single axis that ``validate_mm12_script`` accepts without a warning.
+Below it the straight lines of ``plan_line`` lose most of their saving.'''
+
+Z_TIMING_FIXED = {
+    'Z+' : {'settle' : 75, 'speed' : 100, 'acceleration' : 0, 'lead' : 0},
+    'Z-' : {'settle' : 75, 'speed' : 100, 'acceleration' : 0,
+            'clearance' : 331},
+}
+'''Original, uncalibrated timing of the :math:`Z` translations.'''
+
+Z_TIMING = {
+    'Z+' : {'settle' : 75, 'speed' : 100, 'acceleration' : 0, 'lead' : 60},
+    'Z-' : {'settle' : 75, 'speed' : 100, 'acceleration' : 0,
+            'clearance' : 331},
+}
+'''Timing of the :math:`Z` translations, ``'Z+'`` moves the tool down and
+``'Z-'`` up.  *settle* is the time in milliseconds the tool is given to stop
+vibrating after the servo signal reaches the target, it is sent on every
+translation so it can be changed at any time (see ``calibrate_z_settle``).
+The calibrated values are saved in the machine profile (see
+``save_z_timing``).
+*speed* and *acceleration* are the limits of the servo signal channel in MM12
+units, they are written in the script (see ``mm12_script``).
+
+The combined subroutines (see ``FUSED_PIXEL_TRANSLATIONS``) use *clearance*,
+the time in milliseconds after the tool starts moving up until it is clear of
+the paper and the :math:`XY` translation can start, sent on every call (until
+it is calibrated with ``calibrate_z_clearance`` it is the whole travel plus
+the settle time, as in ``Z_TIMING_FIXED``), and *lead*, the number of low-to-high transitions before the end of the
+:math:`XY` translation when the tool starts moving down, written in the
+script.'''
+
+MM12_PROFILE = {}
+'''Keyword arguments of ``mm12_script`` for the script loaded on the MM12, as
+tuned by ``tune_feed_rate`` for the current machine.  Used by the emulator
+and the time estimates.'''
 
 MM12_SCRIPT_INIT = '''\
 {{servo_acceleration}} {servo_channel} acceleration
@@ -247,7 +433,8 @@ MM12_SUBROUTINES = {
             SUB_SERVO_TEMPLATE.format(
                 name='z_position_off',
                 channel=MM12_AXES_CHANNELS['Z']['channel'],
-                position=MM12_AXES_CHANNELS['Z']['off']*4)
+                position=MM12_AXES_CHANNELS['Z']['off']*4),
+        'parameter' : ('Z-', 'settle'),
     },
     'Z+' : {
         'subroutine_id'       : 9,
@@ -255,10 +442,203 @@ MM12_SUBROUTINES = {
             SUB_SERVO_TEMPLATE.format(
                 name='z_position_on',
                 channel=MM12_AXES_CHANNELS['Z']['channel'],
-                position=MM12_AXES_CHANNELS['Z']['on']*4)
+                position=MM12_AXES_CHANNELS['Z']['on']*4),
+        'parameter' : ('Z+', 'settle'),
+    },
+    'X+Y+P' : {
+        'subroutine_id'       : 10,
+        'subroutine_body' :
+            SUB_STEPPER_DIAGONAL_PIXEL_TEMPLATE.format(
+                name='x_pos_y_pos_pixel',
+                x_dir=MM12_AXES_CHANNELS['X']['dir_positive'],
+                x_dir_channel=MM12_AXES_CHANNELS['X']['dir_channel'],
+                y_dir=MM12_AXES_CHANNELS['Y']['dir_positive'],
+                y_dir_channel=MM12_AXES_CHANNELS['Y']['dir_channel'],
+                off=STEPPER_CHANNELS_TARGET_OFF,
+                x_step_channel=MM12_AXES_CHANNELS['X']['step_channel'],
+                y_step_channel=MM12_AXES_CHANNELS['Y']['step_channel'],
+                on=STEPPER_CHANNELS_TARGET_ON),
+    },
+    'X+Y-P' : {
+        'subroutine_id'       : 11,
+        'subroutine_body' :
+            SUB_STEPPER_DIAGONAL_PIXEL_TEMPLATE.format(
+                name='x_pos_y_neg_pixel',
+                x_dir=MM12_AXES_CHANNELS['X']['dir_positive'],
+                x_dir_channel=MM12_AXES_CHANNELS['X']['dir_channel'],
+                y_dir=MM12_AXES_CHANNELS['Y']['dir_negative'],
+                y_dir_channel=MM12_AXES_CHANNELS['Y']['dir_channel'],
+                off=STEPPER_CHANNELS_TARGET_OFF,
+                x_step_channel=MM12_AXES_CHANNELS['X']['step_channel'],
+                y_step_channel=MM12_AXES_CHANNELS['Y']['step_channel'],
+                on=STEPPER_CHANNELS_TARGET_ON),
+    },
+    'X-Y+P' : {
+        'subroutine_id'       : 12,
+        'subroutine_body' :
+            SUB_STEPPER_DIAGONAL_PIXEL_TEMPLATE.format(
+                name='x_neg_y_pos_pixel',
+                x_dir=MM12_AXES_CHANNELS['X']['dir_negative'],
+                x_dir_channel=MM12_AXES_CHANNELS['X']['dir_channel'],
+                y_dir=MM12_AXES_CHANNELS['Y']['dir_positive'],
+                y_dir_channel=MM12_AXES_CHANNELS['Y']['dir_channel'],
+                off=STEPPER_CHANNELS_TARGET_OFF,
+                x_step_channel=MM12_AXES_CHANNELS['X']['step_channel'],
+                y_step_channel=MM12_AXES_CHANNELS['Y']['step_channel'],
+                on=STEPPER_CHANNELS_TARGET_ON),
+    },
+    'X-Y-P' : {
+        'subroutine_id'       : 13,
+        'subroutine_body' :
+            SUB_STEPPER_DIAGONAL_PIXEL_TEMPLATE.format(
+                name='x_neg_y_neg_pixel',
+                x_dir=MM12_AXES_CHANNELS['X']['dir_negative'],
+                x_dir_channel=MM12_AXES_CHANNELS['X']['dir_channel'],
+                y_dir=MM12_AXES_CHANNELS['Y']['dir_negative'],
+                y_dir_channel=MM12_AXES_CHANNELS['Y']['dir_channel'],
+                off=STEPPER_CHANNELS_TARGET_OFF,
+                x_step_channel=MM12_AXES_CHANNELS['X']['step_channel'],
+                y_step_channel=MM12_AXES_CHANNELS['Y']['step_channel'],
+                on=STEPPER_CHANNELS_TARGET_ON),
     },
 }
-'''Structure that builds and identifies the MM12 script subroutines.'''
+'''Structure that builds and identifies the MM12 script subroutines.  The
+optional *parameter* identifies the value of ``Z_TIMING`` that printerc passes
+to the subroutine on every call (see ``translate``).'''
+
+SUB_Z_OFF_PREFIX_TEMPLATE = '''sub {name}
+  {{z_off_acceleration}} {channel} acceleration
+  {{z_off_speed}} {channel} speed
+  {position} {channel} servo
+  delay                # clearance time (ms), the subroutine parameter.
+'''
+'''Template for the beginning of the MM12 script subroutines that move the
+tool to the off position and, without waiting for the servo to stop, start a
+translation in units of pixels.'''
+
+SUB_Z_ON_PREFIX_TEMPLATE = '''sub {name}
+  {{z_on_acceleration}} {channel} acceleration
+  {{z_on_speed}} {channel} speed
+'''
+'''Template for the beginning of the MM12 script subroutines that perform a
+translation in units of pixels and then move the tool to the on position.'''
+
+SUB_Z_ON_LEAD_TEMPLATE = '''    dup {{z_lead}} equals if {position} {channel} servo endif
+'''
+'''Line of the loop of the subroutines that perform a translation and then
+move the tool to the on position, it starts moving the tool when there are
+``z_lead`` transitions left.'''
+
+SUB_Z_ON_SUFFIX_TEMPLATE = '''  drop
+  {position} {channel} servo
+  begin
+    get_moving_state
+  while
+    # wait until is is no longer moving.
+  repeat
+  delay                # settle time (ms), the subroutine parameter.
+  quit
+'''
+'''Template for the end of the MM12 script subroutines that perform a
+translation in units of pixels and then move the tool to the on position.'''
+
+FUSED_PIXEL_TRANSLATIONS = ('X-P', 'X+P', 'Y-P', 'Y+P',
+                            'X+Y+P', 'X+Y-P', 'X-Y+P', 'X-Y-P')
+'''Translations in units of pixels that have subroutines combined with
+:math:`Z` translations: ``'Z-'`` followed by the translation (the *adm* code
+is prefixed with ``'Z-'``) and the translation followed by ``'Z+'`` (suffixed
+with ``'Z+'``), see ``overlap_z``.'''
+
+for _adm in FUSED_PIXEL_TRANSLATIONS:
+    _name, _body = MM12_SUBROUTINES[_adm]['subroutine_body'].split('\n', 1)
+    _name = _name.split()[1]
+    MM12_SUBROUTINES['Z-' + _adm] = {
+        'subroutine_id'       : len(MM12_SUBROUTINES),
+        'subroutine_body' :
+            SUB_Z_OFF_PREFIX_TEMPLATE.format(
+                name='z_off_' + _name,
+                channel=MM12_AXES_CHANNELS['Z']['channel'],
+                position=MM12_AXES_CHANNELS['Z']['off']*4) + _body,
+        'parameter' : ('Z-', 'clearance'),
+    }
+    _body = _body.replace('    1 minus\n', SUB_Z_ON_LEAD_TEMPLATE.format(
+                              channel=MM12_AXES_CHANNELS['Z']['channel'],
+                              position=MM12_AXES_CHANNELS['Z']['on']*4)
+                          + '    1 minus\n')
+    MM12_SUBROUTINES[_adm + 'Z+'] = {
+        'subroutine_id'       : len(MM12_SUBROUTINES),
+        'subroutine_body' :
+            SUB_Z_ON_PREFIX_TEMPLATE.format(
+                name=_name + '_z_on',
+                channel=MM12_AXES_CHANNELS['Z']['channel'])
+            + _body[:-len('  quit\n')]
+            + SUB_Z_ON_SUFFIX_TEMPLATE.format(
+                channel=MM12_AXES_CHANNELS['Z']['channel'],
+                position=MM12_AXES_CHANNELS['Z']['on']*4),
+        'parameter' : ('Z+', 'settle'),
+    }
+
+JOG_TRANSLATIONS = {
+    'X-j' : ('X', 'dir_negative', 'x_neg_jog'),
+    'X+j' : ('X', 'dir_positive', 'x_pos_jog'),
+    'Y-j' : ('Y', 'dir_negative', 'y_neg_jog'),
+    'Y+j' : ('Y', 'dir_positive', 'y_pos_jog'),
+}
+'''Translations of any number of low-to-high transitions, passed as the
+subroutine parameter (see ``translate``): axis, direction and subroutine
+name.'''
+
+for _adm in sorted(JOG_TRANSLATIONS):
+    _axis, _dir, _name = JOG_TRANSLATIONS[_adm]
+    MM12_SUBROUTINES[_adm] = {
+        'subroutine_id'       : len(MM12_SUBROUTINES),
+        'subroutine_body' :
+            SUB_STEPPER_JOG_TEMPLATE.format(
+                name=_name, dir=MM12_AXES_CHANNELS[_axis][_dir],
+                dir_channel=MM12_AXES_CHANNELS[_axis]['dir_channel'],
+                off=STEPPER_CHANNELS_TARGET_OFF,
+                step_channel=MM12_AXES_CHANNELS[_axis]['step_channel'],
+                on=STEPPER_CHANNELS_TARGET_ON),
+    }
+
+ADM_PIXEL_DELTAS = {
+    'X-P' : (-1, 0),
+    'X+P' : (1, 0),
+    'Y-P' : (0, -1),
+    'Y+P' : (0, 1),
+    'X+Y+P' : (1, 1),
+    'X+Y-P' : (1, -1),
+    'X-Y+P' : (-1, 1),
+    'X-Y-P' : (-1, -1),
+}
+for _adm in FUSED_PIXEL_TRANSLATIONS:
+    ADM_PIXEL_DELTAS['Z-' + _adm] = ADM_PIXEL_DELTAS[_adm]
+    ADM_PIXEL_DELTAS[_adm + 'Z+'] = ADM_PIXEL_DELTAS[_adm]
+'''Translation :math:`(x, y)`, in pixels, of the *adm* codes that translate
+the tool in units of pixels (see ``translate``).'''
+
+SIMULATION_ADMS = {
+    'X-p' : (-1, 0, 0),
+    'X+p' : (1, 0, 0),
+    'X-P' : (-TRANSITIONS_PER_PIXEL, 0, 0),
+    'X+P' : (TRANSITIONS_PER_PIXEL, 0, 0),
+    'Y-p' : (0, -1, 0),
+    'Y+p' : (0, 1, 0),
+    'Y-P' : (0, -TRANSITIONS_PER_PIXEL, 0),
+    'Y+P' : (0, TRANSITIONS_PER_PIXEL, 0),
+    'X+Y+P' : (TRANSITIONS_PER_PIXEL, TRANSITIONS_PER_PIXEL, 0),
+    'X+Y-P' : (TRANSITIONS_PER_PIXEL, -TRANSITIONS_PER_PIXEL, 0),
+    'X-Y+P' : (-TRANSITIONS_PER_PIXEL, TRANSITIONS_PER_PIXEL, 0),
+    'X-Y-P' : (-TRANSITIONS_PER_PIXEL, -TRANSITIONS_PER_PIXEL, 0),
+    'Z-'  : (0, 0, -1),
+    'Z+'  : (0, 0, 1),
+}
+for _adm in FUSED_PIXEL_TRANSLATIONS:
+    SIMULATION_ADMS['Z-' + _adm] = SIMULATION_ADMS[_adm][:2] + (-1,)
+    SIMULATION_ADMS[_adm + 'Z+'] = SIMULATION_ADMS[_adm][:2] + (1,)
+'''Effect of each *adm* code on the virtual canvas of ``simulate_toolpath``:
+translation :math:`(x, y)` in low-to-high transitions and :math:`Z`
+translation (``1`` tool on, ``-1`` tool off, ``0`` unchanged).'''
 
 MM12_SCRIPT_RUNNING = '\x00'
 '''Byte value that the MM12 returns when the script is running.'''
@@ -313,6 +693,54 @@ class _GetchWindows:
         import msvcrt
         return msvcrt.getch()
 
+class RawTerminal(object):
+    '''Keep the terminal in raw mode and read every pending key at once.
+
+    The terminal settings are changed when entering the context and restored
+    when leaving it, instead of on every key as ``Getch`` does::
+
+        with RawTerminal() as terminal:
+            keys = terminal.read(0.1)
+    '''
+    def __enter__(self):
+        try:
+            import msvcrt
+            self.msvcrt = msvcrt
+        except ImportError:
+            import tty, termios
+            self.msvcrt = None
+            self.fd = sys.stdin.fileno()
+            self.old_settings = termios.tcgetattr(self.fd)
+            tty.setraw(self.fd)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.msvcrt is None:
+            import termios
+            termios.tcsetattr(self.fd, termios.TCSADRAIN, self.old_settings)
+
+    def read(self, timeout):
+        '''Keys pressed, waiting up to *timeout* seconds for the first one.
+
+        Returns
+        -------
+        keys : str
+            Empty if no key was pressed.
+        '''
+        if self.msvcrt is not None:
+            end = time.time() + timeout
+            while not self.msvcrt.kbhit() and time.time() < end:
+                time.sleep(0.001)
+            keys = []
+            while self.msvcrt.kbhit():
+                keys.append(self.msvcrt.getch())
+            return ''.join(keys)
+
+        import select
+        if select.select([self.fd], [], [], timeout)[0]:
+            return os.read(self.fd, 1024)
+        return ''
+
 def on_exit():
     '''Actions to do on exit.'''
 
@@ -364,10 +792,12 @@ def mm12_script_status():
     assert sp.write('\xae') == 1
     return sp.read(1)
 
-def translate(adm, confirm=False):
+def translate(adm, confirm=False, param=None):
     '''Translate the printerm tool across the :math:`XYZ` space.
 
-    printer73x can only perform translations across a single axis at a time.
+    printer73x performs translations across a single axis at a time, or
+    across the :math:`X` and :math:`Y` axes at the same time in units of
+    pixels (diagonal translations).
 
     Parameters
     ----------
@@ -378,45 +808,149 @@ def translate(adm, confirm=False):
         the number of pulses for the printerm tool to translate a pixel unit
         across the respective axis).
 
-        ======= ================================================================
-        *adm*   translation
-        ======= ================================================================
-        ``X-p`` send 1 single pulse for negative translation across :math:`X`.
-        ``X+p`` send 1 single pulse for positive translation across :math:`X`.
-        ``X-P`` send :math:`n` pulses for negative translation across :math:`X`.
-        ``X+P`` send :math:`n` pulses for positive translation across :math:`X`.
-        ``Y-p`` send 1 single pulse for negative translation across :math:`Y`.
-        ``Y+p`` send 1 single pulse for positive translation across :math:`Y`.
-        ``Y-P`` send :math:`n` pulses for negative translation across :math:`Y`.
-        ``Y+P`` send :math:`n` pulses for positive translation across :math:`Y`.
-        ``Z-``  move the tool to the off position (:math:`Z`).
-        ``Z+``  move the tool to the on position (:math:`Z`).
-        ======= ================================================================
+        ========= ==============================================================
+        *adm*     translation
+        ========= ==============================================================
+        ``X-p``   send 1 single pulse for negative translation across :math:`X`.
+        ``X+p``   send 1 single pulse for positive translation across :math:`X`.
+        ``X-P``   send :math:`n` pulses for negative translation across :math:`X`.
+        ``X+P``   send :math:`n` pulses for positive translation across :math:`X`.
+        ``Y-p``   send 1 single pulse for negative translation across :math:`Y`.
+        ``Y+p``   send 1 single pulse for positive translation across :math:`Y`.
+        ``Y-P``   send :math:`n` pulses for negative translation across :math:`Y`.
+        ``Y+P``   send :math:`n` pulses for positive translation across :math:`Y`.
+        ``X+Y+P`` send :math:`n` pulses for positive translation across :math:`X`
+                  and positive translation across :math:`Y`.
+        ``X+Y-P`` send :math:`n` pulses for positive translation across :math:`X`
+                  and negative translation across :math:`Y`.
+        ``X-Y+P`` send :math:`n` pulses for negative translation across :math:`X`
+                  and positive translation across :math:`Y`.
+        ``X-Y-P`` send :math:`n` pulses for negative translation across :math:`X`
+                  and negative translation across :math:`Y`.
+        ``Z-``    move the tool to the off position (:math:`Z`).
+        ``Z+``    move the tool to the on position (:math:`Z`).
+        ``X-j``   send *param* pulses for negative translation across
+                  :math:`X`.
+        ``X+j``   send *param* pulses for positive translation across
+                  :math:`X`.
+        ``Y-j``   send *param* pulses for negative translation across
+                  :math:`Y`.
+        ``Y+j``   send *param* pulses for positive translation across
+                  :math:`Y`.
+        ========= ==============================================================
     confirm: boolean, optional
         If ``True``, the user must confirm the translation by pressing Enter
         (default is ``False``).
+    param: int, optional
+        Parameter for the subroutine, from 0 to 16383 (default is ``None``,
+        see ``mm12_command``).
+
+    Notes
+    -----
+    Besides the codes in the table, every pixel translation in
+    ``FUSED_PIXEL_TRANSLATIONS`` can be prefixed with ``Z-`` (e.g.
+    ``Z-X+P``) or suffixed with ``Z+`` (e.g. ``X+PZ+``) to combine it with
+    the :math:`Z` translation, overlapping both (see ``overlap_z``).
     '''
     # Start until script is not running.
     while mm12_script_status() == MM12_SCRIPT_RUNNING:
         pass
 
-    subroutine_id = chr( MM12_SUBROUTINES[adm]['subroutine_id'])
-    str2write = ''.join(['\xa7', subroutine_id])
+    str2write = mm12_command(adm, param)
     if confirm:
         raw_input()
-    assert sp.write(str2write) == 2
+    assert sp.write(str2write) == len(str2write)
 
     #if 'Z' in adm:
         #time.sleep(0.1)
 
-def build_mm12_script(fpath, ntransitions=TRANSITIONS_PER_PIXEL, delay=1,
-                      servo_acceleration=0, servo_speed=100):
-    '''Build a script to be loaded on the MM12.
+def mm12_command(adm, param=None):
+    '''Serial command that runs the subroutine of a translation.
+
+    Parameters
+    ----------
+    adm : str
+        See ``translate``.
+    param : int, optional
+        Parameter for the subroutine, from 0 to 16383 (default is ``None``,
+        the ``Z_TIMING`` value identified by the subroutine *parameter*, if
+        any, see ``MM12_SUBROUTINES``).
+
+    Returns
+    -------
+    command : str
+        *Restart Script at Subroutine* command, *with Parameter* if there is
+        one.
+    '''
+    subroutine = MM12_SUBROUTINES[adm]
+    if param is None and 'parameter' in subroutine:
+        z_adm, key = subroutine['parameter']
+        param = Z_TIMING[z_adm][key]
+
+    subroutine_id = chr(subroutine['subroutine_id'])
+    if param is None:
+        return ''.join(['\xa7', subroutine_id])
+    return ''.join(['\xa8', subroutine_id, chr(param & 0x7f),
+                    chr(param >> 7 & 0x7f)])
+
+def unroll_pulse_loop(body, unroll, busy_wait=0):
+    '''Rewrite the loop of a subroutine that translates in units of pixels so
+    it performs *unroll* transitions per iteration without ``delay``.
+
+    Parameters
+    ----------
+    body : str
+        Subroutine with the values of ``mm12_script`` in place.
+    unroll : int
+        Low-to-high transitions per iteration of the loop.
+    busy_wait : int, optional
+        ``0 drop`` instruction pairs executed after every edge to slow down
+        the pulse train, each pair takes about ``2 * MM12_INSTRUCTION_TIME``
+        (default is 0).  The edges of a diagonal translation write both step
+        channels, three more instructions, so their transitions are padded
+        with three instructions less, one pair after the first edge and two
+        after the second: with *busy_wait* of 2 or more a diagonal transition
+        takes as long as one along a single axis.
+
+    Returns
+    -------
+    body : str
+        The subroutine, unchanged if it has no pulse loop.
+    '''
+    lines = body.split('\n')
+    if '    1 minus' not in lines:
+        return body
+    end = lines.index('    1 minus')
+    start = max(i for i in range(end) if lines[i].strip() == 'while')
+
+    halves = [[]]
+    lead = []
+    for line in lines[start + 1:end]:
+        if line.strip().endswith(' delay'):
+            halves.append([])
+        elif ' if ' in line:
+            lead.append(line)
+        else:
+            halves[-1].append(line)
+    pairs = [busy_wait, busy_wait]
+    if len(halves[0]) > 1:
+        pairs = [busy_wait - 1, busy_wait - 2]
+    pulse = []
+    for half, npairs in zip(halves, pairs):
+        pulse.extend(half)
+        if npairs > 0:
+            pulse.append('    ' + ' '.join(['0 drop'] * npairs))
+
+    return '\n'.join(lines[:start + 1] + pulse * unroll + lead
+                     + ['    {0} minus'.format(unroll)] + lines[end + 1:])
+
+def mm12_script(ntransitions=TRANSITIONS_PER_PIXEL, delay=1,
+                servo_acceleration=None, servo_speed=None, z_timing=None,
+                unroll=None, busy_wait=0):
+    '''Generate the script to be loaded on the MM12.
 
     Parameters
     ----------
-    fpath : str-like
-        Path location where to save the script file.
     ntransitions : int, optional
         Number of low-to-high transitions to perform in the subroutines that
         performs translation in units of pixels through the stepper motor
@@ -426,10 +960,37 @@ def build_mm12_script(fpath, ntransitions=TRANSITIONS_PER_PIXEL, delay=1,
         perform translation through the stepper motors (default is 1).
     servo_acceleration : int, optional
         Sets the acceleration of the servo signal channel in units of (0.25
-        us)/(10 ms)/(80 ms) (default is 0).
+        us)/(10 ms)/(80 ms) for both :math:`Z` translations (default is
+        ``None``, use *z_timing*).
     servo_speed : int, optional
         Sets the speed of the servo signal channel in units of (0.25 us)/(10
-        ms) (default is 100).
+        ms) for both :math:`Z` translations (default is ``None``, use
+        *z_timing*).
+    z_timing : dict, optional
+        Speed and acceleration of the servo signal channel for each :math:`Z`
+        translation and *lead* of the tool on translation, with the structure
+        of ``Z_TIMING`` (default is ``Z_TIMING``).  *lead* is reduced if the
+        tool could reach the paper before the :math:`XY` translation ends.
+    unroll : int, optional
+        If given, the subroutines that translate in units of pixels perform
+        *unroll* transitions per iteration of their loop, timed by the
+        execution of the instructions instead of ``delay``, whose 1 ms
+        granularity limits the step rate (see ``unroll_pulse_loop``).  It
+        must divide *ntransitions*, *delay* is ignored by these subroutines
+        (default is ``None``, one transition per iteration with *delay*).
+        The ``JOG_TRANSLATIONS`` subroutines are timed the same way, one
+        transition per iteration.
+    busy_wait : int, optional
+        See ``unroll_pulse_loop``, only used with *unroll* (default is 0).
+
+    Returns
+    -------
+    script : str
+
+    Raises
+    ------
+    ValueError
+        If *unroll* doesn't divide *ntransitions*.
     '''
 
     def get_subroutine_key_by_id(subroutine_id):
@@ -437,285 +998,2363 @@ def build_mm12_script(fpath, ntransitions=TRANSITIONS_PER_PIXEL, delay=1,
             if subroutine_id is value['subroutine_id']:
                 return key
 
-    for intarg in (ntransitions, delay, servo_acceleration, servo_speed):
-        assert isinstance(intarg, int)
-
-    with open(fpath, 'w') as f:
-        print >>f, MM12_SCRIPT_INIT.format(servo_acceleration=servo_acceleration,
-                                       servo_speed=servo_speed)
+    if z_timing is None:
+        z_timing = Z_TIMING
+    z_timing = dict((adm, dict(timing)) for adm, timing in z_timing.items())
+    for timing in z_timing.values():
+        if servo_acceleration is not None:
+            timing['acceleration'] = servo_acceleration
+        if servo_speed is not None:
+            timing['speed'] = servo_speed
 
-        for i in range(len( MM12_SUBROUTINES)):
-            subroutine_key = get_subroutine_key_by_id(i)
-            subroutine_body = MM12_SUBROUTINES[subroutine_key]['subroutine_body']
+    for intarg in (ntransitions, delay, busy_wait):
+        assert isinstance(intarg, int)
+    if unroll is not None and (unroll < 1 or ntransitions % unroll):
+        raise ValueError('unroll must divide {0} transitions'.format(
+                         ntransitions))
+    for timing in z_timing.values():
+        for intarg in (timing['speed'], timing['acceleration']):
+            assert isinstance(intarg, int)
+
+    # The tool starts off.
+    parts = [MM12_SCRIPT_INIT.format(
+        servo_acceleration=z_timing['Z-']['acceleration'],
+        servo_speed=z_timing['Z-']['speed'])]
+
+    # Start moving the tool down only as early as it can't reach the paper
+    # before the XY translation ends.
+    travel = z_translation_time('Z+', z_timing) - z_timing['Z+']['settle'] / 1000
+    if unroll is None:
+        transition_time = 2 * delay / 1000
+    else:
+        # Two edges of three instructions each plus the busy wait.
+        transition_time = (6 + 4 * busy_wait) * MM12_INSTRUCTION_TIME
+    z_lead = min(z_timing['Z+']['lead'], int(travel / transition_time))
+    if unroll is not None:
+        # The counter of the loop decreases by unroll.
+        z_lead -= z_lead % unroll
+
+    values = {
+        'delay'              : delay,
+        'z_on_speed'         : z_timing['Z+']['speed'],
+        'z_on_acceleration'  : z_timing['Z+']['acceleration'],
+        'z_off_speed'        : z_timing['Z-']['speed'],
+        'z_off_acceleration' : z_timing['Z-']['acceleration'],
+        'z_lead'             : z_lead,
+    }
+
+    for i in range(len( MM12_SUBROUTINES)):
+        subroutine_key = get_subroutine_key_by_id(i)
+        subroutine_body = MM12_SUBROUTINES[subroutine_key]['subroutine_body']
+
+        if subroutine_key in z_timing:
+            values['speed'] = z_timing[subroutine_key]['speed']
+            values['acceleration'] = z_timing[subroutine_key]['acceleration']
+        subroutine_body = subroutine_body.format(**values)
+
+        if 'P' in subroutine_key:
+            subroutine_body = subroutine_body.format(ntransitions=ntransitions)
+            if unroll is not None:
+                subroutine_body = unroll_pulse_loop(subroutine_body, unroll,
+                                                    busy_wait)
+        elif subroutine_key in JOG_TRANSLATIONS and unroll is not None:
+            # The parameter can be any number of transitions.
+            subroutine_body = unroll_pulse_loop(subroutine_body, 1, busy_wait)
+
+        parts.append(subroutine_body)
+
+    return ''.join(part + '\n' for part in parts)
+
+def mm12_script_size(script):
+    '''Estimate the size of a script compiled by the Maestro Control Center.
+
+    Every instruction takes 1 byte, literals 2 bytes (0 to 255) or 3 bytes,
+    jumps (``while``, ``repeat``, ``if`` and ``else``) and subroutine calls 3
+    bytes.  The compiler packs consecutive literals, so this is an upper
+    bound.
 
-            if 'Z' not in subroutine_key:
-                subroutine_body = subroutine_body.format(delay=delay)
+    Parameters
+    ----------
+    script : str
+        MM12 script (see ``mm12_script``).
 
-                if 'P' in subroutine_key:
-                    subroutine_body = subroutine_body.format(ntransitions=ntransitions)
+    Returns
+    -------
+    nbytes : int
+    '''
+    tokens = []
+    for line in script.splitlines():
+        tokens.extend(line.split('#')[0].lower().split())
+    names = set(tokens[i + 1] for i, token in enumerate(tokens)
+                if token == 'sub')
+    nbytes = 0
+    skip = False
+    for token in tokens:
+        if skip or token in ('begin', 'endif'):
+            skip = False
+        elif token == 'sub':
+            skip = True
+        elif token.lstrip('-').isdigit():
+            nbytes += 2 if 0 <= int(token) < 256 else 3
+        elif token in ('while', 'repeat', 'if', 'else') or token in names:
+            nbytes += 3
+        else:
+            nbytes += 1
+    return nbytes
 
-            print >>f, subroutine_body
+def build_mm12_script(fpath, ntransitions=TRANSITIONS_PER_PIXEL, delay=1,
+                      servo_acceleration=None, servo_speed=None, z_timing=None,
+                      unroll=None, busy_wait=0):
+    '''Build a script to be loaded on the MM12.
 
-def prepare_img(imgpath, invert=False, show=False):
-    '''Perform any necessary processing for the input image to be reproduced by
-    printerm.
+    The script is checked with ``validate_mm12_script`` before it is saved.
 
     Parameters
     ----------
-    imgpath : str-like
-        Path to the image file.  Must be PNG, 8-bit grayscale, non-interlaced.
-    invert : boolean, optional
-        Invert the image if ``True`` (default is ``False``).
-    show : boolean, optional
-        Show the image if ``True`` (default is ``False``).
-
-    Notes
-    -----
-    This function sets the following global names:
+    fpath : str-like
+        Path location where to save the script file.
+    ntransitions, delay, servo_acceleration, servo_speed, z_timing : optional
+        See ``mm12_script``.
+    unroll, busy_wait : optional
+        See ``mm12_script``.
 
-    **img** : array of booleans
-        2-d array representation of the image.
-    **b** : int
-        Image's height, number of rows in the array representation.
-    **w** : int
-        Image's width, number of columns in the array representation.
+    Returns
+    -------
+    report : dict
+        See ``validate_mm12_script``.
     '''
-    global img, b, w
-    print 'Loading ``{0}``...'.format(imgpath)
-    img = mpimg.imread(fname=imgpath, format='png')
-    b, w = img.shape
-    npixels = b * w
-    nprints = nnotprints = 0
-    assert (b > 0) and (w > 0)
-
-    print 'Processing the image...'
-    # only total black and white, no grays.
-    for i in range(b):
-        for j in range(w):
-            if img[i][j] < 0.9:
-                img[i][j] = 0.0
-            else:
-                img[i][j] = 1.0
+    script = mm12_script(ntransitions, delay, servo_acceleration, servo_speed,
+                         z_timing, unroll, busy_wait)
+    report = validate_mm12_script(script, ntransitions)
+    with open(fpath, 'w') as f:
+        f.write(script)
+    return report
 
-    if invert:
-        print 'Inverting image...'
-        for i in range(b):
-            for j in range(w):
-                if img[i][j] > 0.0:
-                    img[i][j] = 0.0
-                else:
-                    img[i][j] = 1.0
+def servo_frame(position, velocity, target, speed, acceleration):
+    '''Update of a servo channel during one ``SERVO_FRAME`` period.
 
-    # Check for pixel with and without color.
-    for i in range(b):
-        for j in range(w):
-            if img[i][j] > 0.0:
-                nnotprints += 1
-            else:
-                nprints += 1
-    assert (nnotprints + nprints) == npixels
+    Parameters
+    ----------
+    position, velocity : float
+        Current position, in quarter-:math:`\\mu s`, and speed, in
+        quarter-:math:`\\mu s` per frame, of the channel.
+    target : int
+        Target of the channel in quarter-:math:`\\mu s`.
+    speed, acceleration : int
+        Speed and acceleration limits of the channel in MM12 units, ``0``
+        means no limit.
 
-    # If ``nprints == 0`` then no pixel will be printed.
-    assert nprints > 0
+    Returns
+    -------
+    position, velocity : float
+    '''
+    remaining = abs(target - position)
+    if speed == 0 and acceleration == 0:
+        return target, 0.0
+
+    limit = speed if speed else float('inf')
+    if acceleration:
+        # Acceleration is given per 80 ms, frames are 10 ms long.
+        step = acceleration / 8
+        limit = min(limit, velocity + step, (2 * step * remaining) ** 0.5)
+        limit = max(limit, step)
+    velocity = min(limit, remaining)
+    if target > position:
+        return position + velocity, velocity
+    return position - velocity, velocity
+
+def z_translation_time(adm, z_timing=None):
+    '''Modeled time of a :math:`Z` translation.
 
-    print 'Loaded ``{0}`` with {1} pixels, {2} of which have color'.format(
-             imgpath, npixels, nprints)
-    plt.close('all')
-    if show:
-        plt.imshow(img, cmap=cm.gray)
-        plt.show()
+    Parameters
+    ----------
+    adm : {``'Z+'``, ``'Z-'``}
+        See ``translate``.
+    z_timing : dict, optional
+        Structure of ``Z_TIMING`` (default is ``Z_TIMING``).
 
-def connect_printerm(commandport_id):
-    '''Connect printerc with printerm through the MM12 command port.
+    Returns
+    -------
+    seconds : float
+        Time the servo signal takes to reach the target from the opposite
+        position plus the settle time.
+    '''
+    if z_timing is None:
+        z_timing = Z_TIMING
+    timing = z_timing[adm]
+    channel = MM12_AXES_CHANNELS['Z']
+    target = channel['on' if adm == 'Z+' else 'off'] * 4
+    position = channel['off' if adm == 'Z+' else 'on'] * 4
+    velocity = 0.0
+    nframes = 0
+    while position != target:
+        position, velocity = servo_frame(position, velocity, target,
+                                         timing['speed'],
+                                         timing['acceleration'])
+        nframes += 1
+    return nframes * SERVO_FRAME + timing['settle'] / 1000
+
+class MM12Emulator(object):
+    '''Emulator of the MM12 command port and script interpreter.
+
+    It can be used in place of the serial port opened by ``connect_printerm``
+    to run printerc without printerm, or to measure how long the subroutines
+    of a script take to execute.  Commands are executed as soon as they are
+    written and advance the virtual clock ``clock``, in seconds.  Each script
+    instruction takes ``MM12_INSTRUCTION_TIME`` and the servo channels are
+    updated every ``SERVO_FRAME``.
+
+    Only the subset of the MM12 scripting language used by printerc is
+    supported.  The code before the first subroutine is run when the emulator
+    is created.
 
     Parameters
     ----------
-    commandport_id : str or int
-        Serial device name or port number number of the MM12 serial command
-        port.
+    script : str
+        MM12 script (see ``mm12_script``).
     '''
+    port = 'emulator'
+
+    BINARY_OPERATORS = {
+        'plus'         : operator.add,
+        'minus'        : operator.sub,
+        'times'        : operator.mul,
+        'equals'       : operator.eq,
+        'less_than'    : operator.lt,
+        'greater_than' : operator.gt,
+    }
+
+    def __init__(self, script):
+        self.ticks = 0      # Virtual time in microseconds.
+        self.frame = 0      # Servo frames already updated.
+        self.targets = [0] * 12
+        self.positions = [0.0] * 12
+        self.velocities = [0.0] * 12
+        self.speeds = [0] * 12
+        self.accelerations = [0] * 12
+        self.transitions = [0] * 12
+        self.ninstructions = 0
+        self._output = []
+        self._compile(script)
+        self._run(0, [])
+
+    def _compile(self, script):
+        tokens = []
+        for line in script.splitlines():
+            tokens.extend(line.split('#')[0].lower().split())
+
+        self.code = []
+        self.subroutines = []
+        self.addresses = {}
+        self.jumps = {}
+        blocks = []
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            if token == 'sub':
+                if not self.subroutines:
+                    # End of the code run when the script starts.
+                    self.code.append('quit')
+                self.addresses[tokens[i + 1]] = len(self.code)
+                self.subroutines.append(tokens[i + 1])
+                i += 2
+                continue
+            address = len(self.code)
+            if token in ('begin', 'if'):
+                blocks.append([address])
+            elif token in ('while', 'else'):
+                blocks[-1].append(address)
+            elif token == 'repeat':
+                block = blocks.pop()
+                self.jumps[address] = block[0]
+                if len(block) > 1:
+                    self.jumps[block[1]] = address + 1
+            elif token == 'endif':
+                block = blocks.pop()
+                if len(block) > 1:
+                    self.jumps[block[0]] = block[1] + 1
+                    self.jumps[block[1]] = address
+                else:
+                    self.jumps[block[0]] = address
+            self.code.append(token)
+            i += 1
+        self.code.append('quit')
+
+    @property
+    def clock(self):
+        return self.ticks / 1e6
+
+    def _advance(self, seconds):
+        self._advance_to(self.ticks + int(round(seconds * 1e6)))
+
+    def _advance_to(self, ticks):
+        # Integer time, so every frame is updated exactly once.
+        frame_ticks = int(round(SERVO_FRAME * 1e6))
+        while (self.frame + 1) * frame_ticks <= ticks:
+            self._update_servos()
+            self.frame += 1
+        self.ticks = ticks
+
+    def _update_servos(self):
+        for channel in range(12):
+            if self.positions[channel] != self.targets[channel]:
+                self.positions[channel], self.velocities[channel] = \
+                    servo_frame(self.positions[channel],
+                                self.velocities[channel],
+                                self.targets[channel], self.speeds[channel],
+                                self.accelerations[channel])
+
+    def _moving(self):
+        return self.positions != self.targets
+
+    def _set_target(self, channel, target):
+        # Low-to-high transitions, the first target is not one.
+        if 0 < self.targets[channel] < target:
+            self.transitions[channel] += 1
+        # Without limits, or without a previous target, the channel goes
+        # straight to the target.
+        if (self.speeds[channel] == 0 and self.accelerations[channel] == 0
+                or self.targets[channel] == 0):
+            self.positions[channel] = target
+        self.targets[channel] = target
+
+    def _run(self, pc, stack):
+        calls = []
+        code = self.code
+        while True:
+            token = code[pc]
+            pc += 1
+            self.ninstructions += 1
+            self._advance(MM12_INSTRUCTION_TIME)
+            if token.lstrip('-').isdigit():
+                stack.append(int(token))
+            elif token in ('begin', 'endif'):
+                pass
+            elif token in ('while', 'if'):
+                if not stack.pop():
+                    pc = self.jumps[pc - 1]
+            elif token in ('repeat', 'else'):
+                pc = self.jumps[pc - 1]
+            elif token == 'dup':
+                stack.append(stack[-1])
+            elif token == 'drop':
+                stack.pop()
+            elif token == 'swap':
+                stack[-2:] = stack[:-3:-1]
+            elif token == 'over':
+                stack.append(stack[-2])
+            elif token in self.BINARY_OPERATORS:
+                b = stack.pop()
+                stack.append(int(self.BINARY_OPERATORS[token](stack.pop(), b)))
+            elif token == 'servo':
+                channel = stack.pop()
+                self._set_target(channel, stack.pop())
+            elif token == 'speed':
+                channel = stack.pop()
+                self.speeds[channel] = stack.pop()
+            elif token == 'acceleration':
+                channel = stack.pop()
+                self.accelerations[channel] = stack.pop()
+            elif token == 'delay':
+                self._advance(stack.pop() / 1000)
+            elif token == 'get_moving_state':
+                if self._moving():
+                    # Positions only change on frame boundaries, skip to the
+                    # next one.
+                    self._advance_to((self.frame + 1)
+                                     * int(round(SERVO_FRAME * 1e6)))
+                stack.append(int(self._moving()))
+            elif token == 'get_position':
+                stack.append(int(self.positions[stack.pop()]))
+            elif token in self.addresses:
+                calls.append(pc)
+                pc = self.addresses[token]
+            elif token == 'return':
+                pc = calls.pop()
+            elif token == 'quit':
+                return stack
+            else:
+                raise ValueError('unsupported MM12 instruction ``{0}``'.format(
+                                 token))
+
+    def run_subroutine(self, subroutine_id, parameter=None):
+        '''Run a subroutine to completion, as if the *Restart Script at
+        Subroutine* command was received.
+
+        Returns
+        -------
+        seconds : float
+            Virtual time the subroutine took.
+        '''
+        start = self.clock
+        stack = [] if parameter is None else [parameter]
+        name = self.subroutines[subroutine_id]
+        self._run(self.addresses[name], stack)
+        return self.clock - start
+
+    def write(self, data):
+        i = 0
+        while i < len(data):
+            command = data[i]
+            if command == '\xae':
+                self._output.append(MM12_SCRIPT_STOPPED)
+                i += 1
+            elif command == '\xa7':
+                self.run_subroutine(ord(data[i + 1]))
+                i += 2
+            elif command == '\xa8':
+                self.run_subroutine(ord(data[i + 1]),
+                                    ord(data[i + 2]) | ord(data[i + 3]) << 7)
+                i += 4
+            else:
+                raise ValueError('unsupported MM12 command {0!r}'.format(
+                                 command))
+        return len(data)
 
-    global sp
+    def read(self, size=1):
+        data = ''.join(self._output[:size])
+        del self._output[:size]
+        return data
 
-    sp = serial.Serial(port=commandport_id)
-    assert sp.isOpen()
-    print >>logf, '``{0}`` just opened *command port* ``{1}``'.format(PN, sp.port)
+    def flush(self):
+        pass
 
+    def isOpen(self):
+        return True
 
-    msg = '``{0}`` is now connected to ``printerm`` through ``{1}``'.format(
-        PN, sp.port)
-    for f in (logf, sys.stdout):
-        print >>f, msg
+    def close(self):
+        pass
 
-def manual_translation_mode(precise=True):
-    '''Manually translate the printerm tool across the :math:`XY` plane.
+def emulate_toolpath(toolpath, script=None):
+    '''Execution time of a toolpath on the MM12 emulator.
 
     Parameters
     ----------
-    precise : boolean, optional
-        If ``True``, perform translation in units of single low-to-high transitions
-        sent to the stepper motor drivers (how much the tool is translated
-        depends on the microstep format selected through the XMS1, XMS2, YMS1,
-        YMS2 jumpers in mcircuit).  If ``False`` perform translation in units
-        of pixels (default is True).
-    '''
-
-    if precise:
-        keys2translation = {
-            'h' : 'X-p',
-            'l' : 'X+p',
-            'j' : 'Y+p',
-            'k' : 'Y-p',
-            'i' : 'Z+',
-            'o' : 'Z-',
-        }
-    else:
-        keys2translation = {
-            'h' : 'X-P',
-            'l' : 'X+P',
-            'j' : 'Y+P',
-            'k' : 'Y-P',
-            'i' : 'Z+',
-            'o' : 'Z-',
-        }
+    toolpath : sequence of str
+        Sequence of *adm* codes (see ``translate``).
+    script : str, optional
+        MM12 script (default is the script generated by ``mm12_script`` with
+        ``MM12_PROFILE``).
 
-    getch = Getch()
+    Returns
+    -------
+    seconds : float
+        Emulated time, without the serial communication.
+    '''
+    if script is None:
+        script = mm12_script(**MM12_PROFILE)
+    emulator = MM12Emulator(script)
+    start = emulator.clock
+    for adm in toolpath:
+        emulator.write(mm12_command(adm))
+    return emulator.clock - start
 
-    while True:
-        ch = getch()
-        if ch not in keys2translation.keys():
-            break
-        while mm12_script_status() == MM12_SCRIPT_RUNNING:
-            pass
-        translate(keys2translation[ch], confirm=False)
+def validate_mm12_script(script, ntransitions=TRANSITIONS_PER_PIXEL):
+    '''Check a script on the MM12 emulator.
 
-def print_pixel(confirm=False):
-    if confirm:
-        raw_input()
-    translate('Z+', confirm=False)
-    translate('Z-', confirm=False)
+    Every subroutine that translates the tool is run once and the
+    low-to-high transitions of the step channels are counted.
 
-def print_image(confirm=False):
-    def report_position(x, y):
-        print 'At row {0}, column {1}'.format(y, x)
+    Parameters
+    ----------
+    script : str
+        MM12 script (see ``mm12_script``).
+    ntransitions : int, optional
+        Transitions per pixel the script was generated with (default is
+        ``TRANSITIONS_PER_PIXEL``).
 
-    def print_img_pixel(x, y, confirm=False):
-        if img[y][x] == 0.0:
-            print_pixel(confirm)
+    Returns
+    -------
+    report : dict
+        Estimated size of the compiled script in ``bytes`` (see
+        ``mm12_script_size``), for each translation in units of pixels
+        without :math:`Z` translation, the step ``rates`` in transitions per
+        second, and a list of ``warnings``, if the diagonal translations are
+        much slower than the rest (see ``DIAGONAL_RATE_TOLERANCE``).
+
+    Raises
+    ------
+    ValueError
+        If the script doesn't fit in ``MM12_SCRIPT_MEMORY`` or a subroutine
+        performs the wrong number of transitions.
+    '''
+    nbytes = mm12_script_size(script)
+    if nbytes > MM12_SCRIPT_MEMORY:
+        raise ValueError('The script takes about {0} bytes, the MM12 has '
+                         '{1}'.format(nbytes, MM12_SCRIPT_MEMORY))
+
+    emulator = MM12Emulator(script)
+    rates = {}
+    for adm, (dx, dy, z) in sorted(SIMULATION_ADMS.items()):
+        if dx == dy == 0:
+            continue
+        # Pixel translations are counted in pixels of ntransitions.
+        if abs(dx) == TRANSITIONS_PER_PIXEL or abs(dy) == TRANSITIONS_PER_PIXEL:
+            dx, dy = (int(np.sign(d)) * ntransitions for d in (dx, dy))
+        before = list(emulator.transitions)
+        start = emulator.clock
+        emulator.write(mm12_command(adm))
+        seconds = emulator.clock - start
+        counts = [emulator.transitions[MM12_AXES_CHANNELS[axis]['step_channel']]
+                  - before[MM12_AXES_CHANNELS[axis]['step_channel']]
+                  for axis in ('X', 'Y')]
+        if counts != [abs(dx), abs(dy)]:
+            raise ValueError('``{0}`` performs {1} transitions, expected '
+                             '{2}'.format(adm, counts, [abs(dx), abs(dy)]))
+        if 'P' in adm and not z:
+            rates[adm] = max(counts) / seconds
+
+    warnings = []
+    for adm in sorted(rates):
+        if len(adm) > 3 and rates[adm] < DIAGONAL_RATE_TOLERANCE * rates['X+P']:
+            warnings.append('``{0}`` steps at {1:.1f} transitions/s, {2:.0%} '
+                            'of ``X+P``'.format(adm, rates[adm],
+                                                rates[adm] / rates['X+P']))
+    return {'bytes' : nbytes, 'rates' : rates, 'warnings' : warnings}
+
+def print_calibration_pattern(dot, candidates, ndots=5, spacing=2):
+    '''Print a calibration pattern and ask the operator for the result.
+
+    printerc must be connected with printerm, the tool at the HOME position
+    over a test sheet.  For each candidate value, in order, a row of *ndots*
+    dots is printed, then the tool returns to the HOME position and the
+    operator enters the number of the last row whose dots are clean (no
+    smears, no tails, no missing dots).
 
-    try:
+    Parameters
+    ----------
+    dot : callable
+        Called as ``dot(candidate)``, returns the sequence of ``(adm,
+        param)`` translations (see ``translate``) that print a dot and leave
+        the tool *spacing* pixels to the right.
+    candidates : sequence of int
+        Values to try, from the safest to the most aggressive.
+    ndots : int, optional
+        Number of dots per row (default is 5).
+    spacing : int, optional
+        Pixels between dots and between rows (default is 2).
 
-        msg = 'Preparing to print an image with {0} rows and {1} columns'.format(b,
-                                                                                 w)
-        print msg
+    Returns
+    -------
+    candidate : int
+        The candidate of the last clean row.
+    '''
+    toolpath = []
+    for row, candidate in enumerate(candidates):
+        print 'Row {0}: {1}'.format(row, candidate)
+        for i in range(ndots):
+            toolpath.extend(dot(candidate))
+        toolpath.extend([(adm, None) for adm in plan_line(
+            spacing * ndots, 0, 0, spacing)])
+    toolpath.extend([('Y-P', None)] * spacing * len(candidates))
 
-        x = y = 0   # We are at HOME position.
-        while True:
+    for adm, param in toolpath:
+        translate(adm, param=param)
 
-            print 'Printing across the row {0}'.format(y)
-            while True:
-                report_position(x, y)
-                print_img_pixel(x, y, confirm)
-                if x == w - 1:
-                    break
-                translate('X+P', confirm)
-                x += 1
+    return candidates[int(raw_input('Last row with clean dots: '))]
 
-            print 'Returning to a_{{{0}, 0}}'.format(y)
-            while True:
-                if x == 0:
-                    break
-                translate('X-P', confirm)
-                x -= 1
+def calibrate_z_settle(adm, candidates=(75, 60, 45, 30, 20, 10, 0), ndots=5):
+    '''Interactively calibrate the settle time of a :math:`Z` translation.
 
-            if y == b - 1:
-                break
-            translate('Y+P', confirm)
-            y += 1
+    A row of dots is printed for each candidate settle time of *adm* (see
+    ``print_calibration_pattern``) and ``Z_TIMING`` is updated with the
+    settle time chosen by the operator and saved (see ``save_z_timing``).
 
-        print 'Returning to a_{{0, 0}}'.format(y)
-        while True:
-            if y == 0:
-                break
-            translate('Y-P', confirm)
-            y -= 1
+    Parameters
+    ----------
+    adm : {``'Z+'``, ``'Z-'``}
+        Translation to calibrate, ``'Z+'`` moves the tool down, ``'Z-'`` up.
+    candidates : sequence of int, optional
+        Settle times to try, in milliseconds, in decreasing order.
+    ndots : int, optional
+        Number of dots per row (default is 5).
 
-        print 'The image has been printed'
+    Returns
+    -------
+    settle : int
+        The calibrated settle time, in milliseconds.
+    '''
+    def dot(settle):
+        return [('Z+', settle if adm == 'Z+' else None),
+                ('Z-', settle if adm == 'Z-' else None),
+                ('X+P', None), ('X+P', None)]
+
+    settle = print_calibration_pattern(dot, candidates, ndots)
+    Z_TIMING[adm]['settle'] = settle
+    save_z_timing()
+    print >>logf, 'Calibrated {0} settle time: {1} ms'.format(adm, settle)
+    return settle
+
+def calibrate_z_clearance(candidates=(330, 250, 200, 150, 100, 75, 50),
+                          ndots=5):
+    '''Interactively calibrate the time the tool needs to clear the paper
+    when it moves up, used by the combined subroutines (see ``overlap_z``).
+
+    A row of dots is printed for each candidate clearance time (see
+    ``print_calibration_pattern``), a clearance too short leaves a tail after
+    the dot.  ``Z_TIMING`` is updated with the clearance time chosen by the
+    operator and saved (see ``save_z_timing``).
 
-    except KeyboardInterrupt:
-        sp.flush()
-        print 'Operation interrupted, flushing command port'
+    Parameters
+    ----------
+    candidates : sequence of int, optional
+        Clearance times to try, in milliseconds, in decreasing order.
+    ndots : int, optional
+        Number of dots per row (default is 5).
 
-def print_image_better(confirm=False):
-    def report_position(x, y):
-        print 'At row {0}, column {1}'.format(y, x)
+    Returns
+    -------
+    clearance : int
+        The calibrated clearance time, in milliseconds.
+    '''
+    def dot(clearance):
+        return [('Z+', None), ('Z-X+P', clearance), ('X+P', None)]
 
-    def print_img_pixel(x, y, confirm=False):
-        if img[y][x] == 0.0:
-            print_pixel(confirm)
+    clearance = print_calibration_pattern(dot, candidates, ndots)
+    Z_TIMING['Z-']['clearance'] = clearance
+    save_z_timing()
+    print >>logf, 'Calibrated Z- clearance time: {0} ms'.format(clearance)
+    return clearance
 
-    def color_in_this_row(row):
-        for pixel in row:
-            if pixel == 0.0:
-                return True
-        return False
+def save_z_timing(machine=None):
+    '''Save ``Z_TIMING`` in the profile of a machine (see
+    ``save_machine_profile``), so every later command given the same machine
+    uses the calibrated times and the servo limits of each direction.
 
-    try:
+    Parameters
+    ----------
+    machine : str, optional
+        Name of the machine (default is ``MACHINE``).
+    '''
+    if machine is None:
+        machine = MACHINE
+    save_machine_profile(machine, {'z_timing' : Z_TIMING})
 
-        msg = 'Preparing to print an image with {0} rows and {1} columns'.format(b,
-                                                                                 w)
-        print msg
+def benchmark_z_timing(z_timing=None, ntoggles=1000, baseline=None):
+    '''Compare the time of :math:`Z` translations with two timing settings on
+    the MM12 emulator.
 
-        x = y = 0   # We are at HOME position.
-        while True:
+    Parameters
+    ----------
+    z_timing : dict, optional
+        Structure of ``Z_TIMING`` to evaluate (default is ``Z_TIMING``).
+    ntoggles : int, optional
+        Number of tool on/off cycles (default is 1000).
+    baseline : dict, optional
+        Structure of ``Z_TIMING`` to compare with (default is
+        ``Z_TIMING_FIXED``).
 
-            print 'Printing across the row {0}'.format(y)
-            while True:
-                report_position(x, y)
-                print_img_pixel(x, y, confirm)
-                if x == w - 1:
+    Returns
+    -------
+    seconds : tuple
+        Emulated ``(baseline, z_timing)`` time per on/off cycle.
+    '''
+    if z_timing is None:
+        z_timing = Z_TIMING
+    if baseline is None:
+        baseline = Z_TIMING_FIXED
+
+    times = []
+    for timing in (baseline, z_timing):
+        emulator = MM12Emulator(mm12_script(z_timing=timing))
+        start = emulator.clock
+        for i in range(ntoggles):
+            for adm in ('Z+', 'Z-'):
+                emulator.run_subroutine(MM12_SUBROUTINES[adm]['subroutine_id'],
+                                        timing[adm]['settle'])
+        times.append((emulator.clock - start) / ntoggles)
+
+    print 'Emulated time per tool on/off cycle ({0} cycles):'.format(ntoggles)
+    for name, timing, seconds in zip(('baseline', 'evaluated'),
+                                     (baseline, z_timing), times):
+        print '  {0:<10} {1:7.1f} ms  ({2})'.format(name, 1000 * seconds,
+            ', '.join('{0} settle {1} ms speed {2} acceleration {3}'.format(
+                adm, timing[adm]['settle'], timing[adm]['speed'],
+                timing[adm]['acceleration']) for adm in ('Z+', 'Z-')))
+    print '  saved      {0:7.1f} ms per cycle, {1:.1f} s per 1000 dots'.format(
+        1000 * (times[0] - times[1]), 1000 * (times[0] - times[1]))
+    return tuple(times)
+
+def step_profiles(ntransitions=TRANSITIONS_PER_PIXEL, busy_waits=range(7, -1, -1)):
+    '''Candidate step profiles for ``tune_feed_rate``, from the slowest to the
+    fastest.
+
+    The first candidate is the ``delay`` timed script, then for each busy
+    wait the largest *unroll* that fits in the MM12 script memory.
+
+    Returns
+    -------
+    profiles : list of tuples
+        ``(rate, settings)``, *rate* in transitions per second of a pixel
+        translation along one axis, *settings* the ``mm12_script`` keyword
+        arguments.
+    '''
+    profiles = []
+    for settings in [{'delay' : 1}] + [{'busy_wait' : bw} for bw in busy_waits]:
+        unrolls = [None]
+        if 'busy_wait' in settings:
+            unrolls = [u for u in range(ntransitions, 0, -1)
+                       if ntransitions % u == 0]
+        for unroll in unrolls:
+            if unroll is not None:
+                settings['unroll'] = unroll
+            try:
+                report = validate_mm12_script(mm12_script(ntransitions,
+                                                          **settings),
+                                              ntransitions)
+            except ValueError:
+                continue
+            profiles.append((report['rates']['X+P'], dict(settings)))
+            break
+    profiles.sort(key=operator.itemgetter(0))
+    return profiles
+
+def load_mm12_script(fpath):
+    '''Load a script on the MM12.
+
+    The script is compiled and loaded with Pololu's ``UscCmd`` if it is
+    available, otherwise the operator is asked to load it with the Maestro
+    Control Center.
+
+    Parameters
+    ----------
+    fpath : str-like
+        Path to the script file (see ``build_mm12_script``).
+    '''
+    try:
+        subprocess.check_call(['UscCmd', '--program', fpath])
+    except (OSError, subprocess.CalledProcessError):
+        raw_input('Load ``{0}`` on the MM12 and press Enter '.format(fpath))
+    print >>logf, 'Loaded MM12 script ``{0}``'.format(fpath)
+
+def registration_test(distance=20, repeat=3):
+    '''Translations of the lost steps test of ``tune_feed_rate``.
+
+    A mark is printed, the tool makes *repeat* round trips of *distance*
+    pixels in every direction and prints a second mark, that lands on the
+    first one if no steps were lost.
+
+    Returns
+    -------
+    toolpath : list of str
+        Sequence of *adm* codes (see ``translate``), it ends where it starts.
+    '''
+    mark = ['Z+', 'Z-']
+    trip = []
+    # Four triangles that cover the eight directions.
+    for legs in (('X+P', 'Y+P', 'X-Y-P'), ('X+Y+P', 'X-P', 'Y-P'),
+                 ('Y+P', 'X+Y-P', 'X-P'), ('X+P', 'X-Y+P', 'Y-P')):
+        for adm in legs:
+            trip.extend([adm] * distance)
+    return mark + trip * repeat + mark
+
+def tune_feed_rate(machine=None, distance=20, repeat=3, spacing=3,
+                   servo_speeds=(100, 150, 200, 300, 0),
+                   servo_accelerations=(5, 10, 20, 40, 0), ndots=5,
+                   fpath='mm12_script_tuning.txt'):
+    '''Interactively find the fastest safe settings of the MM12 script and
+    save them as the profile of the machine.
+
+    printerc must be connected with printerm, the tool at the HOME position
+    over a test sheet.  For each candidate of ``step_profiles``, from the
+    slowest, the script is loaded on the MM12 (see ``load_mm12_script``), the
+    ``registration_test`` is printed and the operator confirms whether the
+    two marks coincide.  The sweep stops at the first candidate that loses
+    steps, if the first one does the script of ``MM12_PROFILE`` is loaded
+    back.  The servo speed and then the servo acceleration of each
+    :math:`Z` translation are swept the same way with rows of dots and saved
+    in ``Z_TIMING`` (see ``save_z_timing``).  The step pulse trains of the :math:`XY` translations have no acceleration
+    ramp to tune, every transition is timed the same (see ``mm12_script``),
+    so their rate is all ``step_profiles`` sweeps.
+
+    Parameters
+    ----------
+    machine : str, optional
+        Name of the machine profile (default is ``MACHINE``).
+    distance, repeat : int, optional
+        See ``registration_test``.
+    spacing : int, optional
+        Pixels between the marks of consecutive candidates (default is 3).
+    servo_speeds : sequence of int, optional
+        Speeds of the servo signal channel to try for each :math:`Z`
+        translation, from the safest, ``0`` is unlimited.
+    servo_accelerations : sequence of int, optional
+        Accelerations of the servo signal channel to try for each :math:`Z`
+        translation, from the safest, ``0`` is unlimited.
+    ndots : int, optional
+        Dots per row of the servo patterns (default is 5).
+    fpath : str-like, optional
+        Path where the scripts are written.
+
+    Returns
+    -------
+    profile : dict
+        See ``save_machine_profile``.
+    '''
+    if machine is None:
+        machine = MACHINE
+
+    best = None
+    for row, (rate, settings) in enumerate(step_profiles()):
+        print 'Row {0}: {1:.0f} transitions/s {2}'.format(row, rate, settings)
+        build_mm12_script(fpath, **settings)
+        load_mm12_script(fpath)
+        for adm in registration_test(distance, repeat) + ['Y+P'] * spacing:
+            translate(adm)
+        answer = raw_input('Do the two marks of row {0} coincide? [y/N] '
+                           .format(row))
+        if answer.strip().lower() != 'y':
+            break
+        best = rate, settings
+    if best is None:
+        print 'No step profile is safe, keeping the current script'
+        # The MM12 runs the script of the rejected candidate.
+        build_mm12_script(fpath, **MM12_PROFILE)
+        load_mm12_script(fpath)
+        return None
+    rate, settings = best
+
+    # Lost steps leave the tool at an unknown position.
+    raw_input('Move the tool to the HOME position over a clean area and '
+              'press Enter ')
+    z_timing = dict((adm, dict(timing)) for adm, timing in Z_TIMING.items())
+    row = 0
+    for adm in ('Z+', 'Z-'):
+        for key, candidates in (('speed', servo_speeds),
+                                ('acceleration', servo_accelerations)):
+            for value in candidates:
+                print 'Row {0}: {1} servo {2} {3}'.format(row, adm, key, value)
+                candidate = dict(z_timing)
+                candidate[adm] = dict(z_timing[adm], **{key : value})
+                build_mm12_script(fpath, z_timing=candidate, **settings)
+                load_mm12_script(fpath)
+                dots = ['Z+', 'Z-', 'X+P', 'X+P'] * ndots
+                for move in dots + plan_line(2 * ndots, 0, 0, spacing):
+                    translate(move)
+                answer = raw_input('Are the dots of row {0} clean? [y/N] '
+                                   .format(row))
+                row += 1
+                if answer.strip().lower() != 'y':
                     break
-                translate('X+P', confirm)
-                x += 1
+                z_timing = candidate
+
+    build_mm12_script(fpath, z_timing=z_timing, **settings)
+    load_mm12_script(fpath)
+    for adm, timing in z_timing.items():
+        Z_TIMING[adm].update(timing)
+    profile = {'script' : settings, 'rate' : rate, 'z_timing' : Z_TIMING}
+    save_machine_profile(machine, profile)
+    MM12_PROFILE.clear()
+    MM12_PROFILE.update(settings)
+    print >>logf, 'Tuned ``{0}``: {1}'.format(machine, profile)
+    return profile
+
+def load_machine_profile(machine=None, fpath=MACHINE_PROFILES):
+    '''Profile of a machine saved by ``tune_feed_rate`` and the
+    :math:`Z` calibration.
 
-            if y == b - 1:
-                break
-            translate('Y+P', confirm)
-            y += 1
-
-            print 'Printing across the row {0}'.format(y)
-            while True:
-                report_position(x, y)
-                print_img_pixel(x, y, confirm)
-                if x == 0:
+    Parameters
+    ----------
+    machine : str, optional
+        Name of the machine (default is ``MACHINE``).
+    fpath : str-like, optional
+        Path to the profiles file (default is ``MACHINE_PROFILES``).
+
+    Returns
+    -------
+    profile : dict or None
+        See ``save_machine_profile``, ``None`` if the machine has no
+        profile.
+    '''
+    if machine is None:
+        machine = MACHINE
+    try:
+        with open(fpath) as f:
+            return json.load(f).get(machine)
+    except (IOError, ValueError):
+        return None
+
+def save_machine_profile(machine, profile, fpath=MACHINE_PROFILES):
+    '''Save the profile of a machine, the entries of *profile* replace those
+    already saved for the machine and the rest are kept.
+
+    Parameters
+    ----------
+    machine : str
+        Name of the machine.
+    profile : dict
+        ``script``, the keyword arguments of ``mm12_script``, ``rate``, the
+        transitions per second of a pixel translation, ``z_timing``, the
+        calibrated values of ``Z_TIMING``, and ``tuned``, the time it was
+        saved (set by this function).
+    fpath : str-like, optional
+        Path to the profiles file (default is ``MACHINE_PROFILES``).
+    '''
+    try:
+        with open(fpath) as f:
+            profiles = json.load(f)
+    except (IOError, ValueError):
+        profiles = {}
+    profile = dict(profiles.get(machine, {}), **profile)
+    profile['tuned'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    profiles[machine] = profile
+    directory = os.path.dirname(fpath)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(fpath, 'w') as f:
+        json.dump(profiles, f, indent=2, sort_keys=True)
+
+def load_img(imgpath, invert=False):
+    '''Load an image and reduce it to the pixel values printerc understands.
+
+    Parameters
+    ----------
+    imgpath : str-like
+        Path to the image file.  Must be PNG, 8-bit grayscale, non-interlaced.
+    invert : boolean, optional
+        Invert the image if ``True`` (default is ``False``).
+
+    Returns
+    -------
+    img : array of floats
+        2-d array representation of the image, ``0.0`` for the pixels to
+        print and ``1.0`` for the rest.
+
+    Raises
+    ------
+    ValueError
+        If the image is not grayscale or has no pixel to print.
+    '''
+    import matplotlib.image as mpimg
+
+    img = mpimg.imread(fname=imgpath, format='png')
+    if img.ndim != 2 or 0 in img.shape:
+        raise ValueError('``{0}`` is not an 8-bit grayscale image'.format(
+                         imgpath))
+
+    # only total black and white, no grays.
+    img = np.where(img < INK_THRESHOLD, 0.0, 1.0)
+    if invert:
+        img = 1.0 - img
+
+    # If there are no pixels with color then no pixel will be printed.
+    if img.all():
+        raise ValueError('``{0}`` has no pixels with color'.format(imgpath))
+    return img
+
+def prepare_img(imgpath, invert=False, show=False):
+    '''Perform any necessary processing for the input image to be reproduced by
+    printerm.
+
+    Parameters
+    ----------
+    imgpath : str-like
+        Path to the image file.  Must be PNG, 8-bit grayscale, non-interlaced.
+    invert : boolean, optional
+        Invert the image if ``True`` (default is ``False``).
+    show : boolean, optional
+        Show the image if ``True`` (default is ``False``).
+
+    Notes
+    -----
+    This function sets the following global names:
+
+    **img** : array of floats
+        2-d array representation of the image (see ``load_img``).
+    **b** : int
+        Image's height, number of rows in the array representation.
+    **w** : int
+        Image's width, number of columns in the array representation.
+    '''
+    global img, b, w
+    print 'Loading and processing ``{0}``...'.format(imgpath)
+    img = load_img(imgpath, invert)
+    b, w = img.shape
+    npixels = b * w
+    nprints = npixels - int(np.count_nonzero(img))
+
+    print 'Loaded ``{0}`` with {1} pixels, {2} of which have color'.format(
+             imgpath, npixels, nprints)
+    if show:
+        import matplotlib.pyplot as plt
+        import matplotlib.cm as cm
+        plt.close('all')
+        plt.imshow(img, cmap=cm.gray)
+        plt.show()
+
+def prepare_nested(imgpaths, copies=None, invert=False, sheet_width=None,
+                   gap=1):
+    '''Load several images and pack their copies onto one sheet to be
+    printed as a single image (see ``nest_images``).
+
+    Parameters
+    ----------
+    imgpaths : list of str-like
+        Paths to the images (see ``load_img``).
+    copies, sheet_width, gap : optional
+        See ``nest_images``.
+    invert : boolean, optional
+        Invert the images if ``True`` (default is ``False``).
+
+    Returns
+    -------
+    imgs : list of arrays of floats
+        The images loaded.
+    placements, utilization
+        See ``nest_images``.
+
+    Notes
+    -----
+    This function sets the global names ``img``, the sheet, ``b`` and ``w``,
+    as ``prepare_img`` does.
+    '''
+    global img, b, w
+    imgs = [load_img(imgpath, invert) for imgpath in imgpaths]
+    img, placements, utilization = nest_images(imgs, copies, sheet_width, gap)
+    b, w = img.shape
+    print 'Packed {0} images on a sheet with {1} rows and {2} columns, ' \
+          '{3:.0%} used'.format(len(placements), b, w, utilization)
+    return imgs, placements, utilization
+
+def connect_printerm(commandport_id):
+    '''Connect printerc with printerm through the MM12 command port.
+
+    Parameters
+    ----------
+    commandport_id : str or int
+        Serial device name or port number number of the MM12 serial command
+        port, or ``'emulator'`` to use an ``MM12Emulator`` running the script
+        generated by ``mm12_script``.
+    '''
+
+    global sp
+
+    if commandport_id == 'emulator':
+        sp = MM12Emulator(mm12_script(**MM12_PROFILE))
+    else:
+        sp = serial.Serial(port=commandport_id)
+    assert sp.isOpen()
+    print >>logf, '``{0}`` just opened *command port* ``{1}``'.format(PN, sp.port)
+
+
+    msg = '``{0}`` is now connected to ``printerm`` through ``{1}``'.format(
+        PN, sp.port)
+    for f in (logf, sys.stdout):
+        print >>f, msg
+
+def manual_translation_mode(precise=True):
+    '''Manually translate (jog) the printerm tool across the :math:`XY` plane.
+
+    Every tap of a key is honored.  Holding a key translates the tool
+    continuously, faster the longer it is held (see
+    ``JOG_ACCELERATION_PERIOD``), up to the step rate of the
+    ``JOG_TRANSLATIONS`` in the script of ``MM12_PROFILE``: the repetitions
+    of a held key (see ``JOG_REPEAT_INTERVAL``) queue no more than the MM12
+    performs in ``JOG_FEED_PERIOD``.  A pixel takes longer than that, so in
+    pixel mode a held key moves the tool at the full step rate from the
+    first repetition and there is nothing to ramp up.  The keys received
+    while the MM12 is busy are added up and sent as a single translation as
+    soon as it finishes, or before a key of another translation is handled.
+
+    Parameters
+    ----------
+    precise : boolean, optional
+        If ``True``, each key is worth a single low-to-high transition sent
+        to the stepper motor drivers (how much the tool is translated
+        depends on the microstep format selected through the XMS1, XMS2,
+        YMS1, YMS2 jumpers in mcircuit).  If ``False`` each key is worth a
+        pixel (default is True).
+    '''
+    keys2translation = {
+        'h' : 'X-j',
+        'l' : 'X+j',
+        'j' : 'Y+j',
+        'k' : 'Y-j',
+        'i' : 'Z+',
+        'o' : 'Z-',
+    }
+    unit = 1 if precise else TRANSITIONS_PER_PIXEL
+    # Whole units, at least one.
+    limit = int(JOG_FEED_PERIOD / translation_times()['j']) // unit * unit
+    limit = min(max(limit, unit), 0x3fff)
+    position = {'X' : 0, 'Y' : 0}
+    held = None
+    pressed = released = 0.0
+    pending = 0
+
+    def send(adm, ntransitions):
+        # Waits until the MM12 finishes the last translation.
+        translate(adm, param=ntransitions)
+        position[adm[0]] += ntransitions * (-1 if '-' in adm else 1)
+
+    with RawTerminal() as terminal:
+        while True:
+            keys = terminal.read(JOG_POLL_INTERVAL)
+            now = time.time()
+            for ch in keys:
+                adm = keys2translation.get(ch)
+                if adm is None:
                     break
-                translate('X-P', confirm)
-                x -= 1
+                if adm[0] == 'Z':
+                    if pending:
+                        send(held, pending)
+                    held, pending = None, 0
+                    translate(adm)
+                    continue
+                repeat = (adm == held
+                          and 0 < now - released <= JOG_REPEAT_INTERVAL)
+                if adm != held or now - released > JOG_RELEASE_TIMEOUT:
+                    if pending:
+                        send(held, pending)
+                    held, pressed, pending = adm, now, 0
+                released = now
+                if not repeat:
+                    pending = min(pending + unit, 0x3fff)
+                    continue
+                speed = min(2 ** int((now - pressed) / JOG_ACCELERATION_PERIOD),
+                            JOG_MAX_SPEED)
+                # Never drops the taps already queued.
+                pending = max(pending, min(pending + speed * unit, limit))
+            else:
+                if pending and mm12_script_status() != MM12_SCRIPT_RUNNING:
+                    send(held, pending)
+                    pending = 0
+                continue
+            break
+    if pending:
+        send(held, pending)
+
+    msg = 'Jogged {0} transitions across X and {1} across Y'.format(
+        position['X'], position['Y'])
+    for f in (logf, sys.stdout):
+        print >>f, msg
+
+def print_pixel(confirm=False):
+    if confirm:
+        raw_input()
+    translate('Z+', confirm=False)
+    translate('Z-', confirm=False)
+
+def plan_line(x0, y0, x1, y1, diagonal=True):
+    '''Toolpath of the translation from ``(x0, y0)`` to ``(x1, y1)``.
+
+    With diagonal translations the tool follows the digital straight line
+    between both points (Bresenham), where every step is either a diagonal
+    or an axial pixel translation, so the translation takes
+    :math:`\\max(|x_1 - x_0|, |y_1 - y_0|)` steps.  Without them the tool
+    translates across :math:`Y` first and then across :math:`X`.
+
+    Parameters
+    ----------
+    x0, y0, x1, y1 : int
+        Start and end positions, in pixels.
+    diagonal : boolean, optional
+        Use diagonal translations (default is ``True``).
+
+    Returns
+    -------
+    toolpath : list of str
+        Sequence of *adm* codes (see ``translate``).
+    '''
+    dx, dy = x1 - x0, y1 - y0
+    xadm = 'X+P' if dx > 0 else 'X-P'
+    yadm = 'Y+P' if dy > 0 else 'Y-P'
+    if not diagonal:
+        return [yadm] * abs(dy) + [xadm] * abs(dx)
+
+    if abs(dx) >= abs(dy):
+        major, minor, nmajor, nminor = xadm, yadm, abs(dx), abs(dy)
+    else:
+        major, minor, nmajor, nminor = yadm, xadm, abs(dy), abs(dx)
+    if nmajor == 0:
+        return []
+    diagonal_adm = xadm[:2] + yadm
+
+    # Position across the minor axis after each step, rounded to the nearest
+    # pixel; every step that increments it is a diagonal step.
+    k = np.arange(nmajor + 1)
+    minor_position = (2 * k * nminor + nmajor) // (2 * nmajor)
+    is_diagonal = np.diff(minor_position) > 0
+    return [diagonal_adm if d else major for d in is_diagonal]
+
+def plan_polylines(polylines, diagonal=True):
+    '''Toolpath that draws a sequence of polylines.
+
+    Starting from the HOME position, the tool translates to the first vertex
+    of every polyline while off, draws the polyline and finally returns to
+    the HOME position.
+
+    Parameters
+    ----------
+    polylines : sequence of sequences of tuples
+        Every polyline is a sequence of ``(x, y)`` vertices, in pixels.
+    diagonal : boolean, optional
+        Use diagonal translations (default is ``True``, see ``plan_line``).
+
+    Returns
+    -------
+    toolpath : list of str
+        Sequence of *adm* codes (see ``translate``).
+    '''
+    toolpath = []
+    x = y = 0   # We are at HOME position.
+    for polyline in polylines:
+        x1, y1 = polyline[0]
+        toolpath.extend(plan_line(x, y, x1, y1, diagonal))
+        toolpath.append('Z+')
+        x, y = x1, y1
+        for x1, y1 in polyline[1:]:
+            toolpath.extend(plan_line(x, y, x1, y1, diagonal))
+            x, y = x1, y1
+        toolpath.append('Z-')
+    toolpath.extend(plan_line(x, y, 0, 0, diagonal))
+    return toolpath
+
+def plan_image(img):
+    '''Toolpath of ``print_image``.
+
+    Parameters
+    ----------
+    img : array of floats
+        2-d array representation of the image, as set by ``prepare_img``.
+
+    Returns
+    -------
+    toolpath : list of str
+        Sequence of *adm* codes (see ``translate``).
+    '''
+    b, w = img.shape
+    toolpath = []
+
+    x = y = 0   # We are at HOME position.
+    while True:
+        while True:
+            if img[y][x] == 0.0:
+                toolpath.extend(['Z+', 'Z-'])
+            if x == w - 1:
+                break
+            toolpath.append('X+P')
+            x += 1
+
+        toolpath.extend(['X-P'] * x)
+        x = 0
+
+        if y == b - 1:
+            break
+        toolpath.append('Y+P')
+        y += 1
+
+    toolpath.extend(['Y-P'] * y)
+    return toolpath
+
+def plan_image_better(img, diagonal=True):
+    '''Toolpath of ``print_image_better``.
+
+    Parameters
+    ----------
+    img : array of floats
+        2-d array representation of the image, as set by ``prepare_img``.
+    diagonal : boolean, optional
+        Return to the HOME position with diagonal translations (default is
+        ``True``, see ``plan_line``).
+
+    Returns
+    -------
+    toolpath : list of str
+        Sequence of *adm* codes (see ``translate``).
+    '''
+    b, w = img.shape
+    toolpath = []
 
-            if y == b - 1:
+    x = y = 0   # We are at HOME position.
+    while True:
+        while True:
+            if img[y][x] == 0.0:
+                toolpath.extend(['Z+', 'Z-'])
+            if x == w - 1:
                 break
-            translate('Y+P', confirm)
-            y += 1
+            toolpath.append('X+P')
+            x += 1
+
+        if y == b - 1:
+            break
+        toolpath.append('Y+P')
+        y += 1
 
-        print 'Returning to a_{{0, 0}}'.format(y)
         while True:
-            if y == 0:
+            if img[y][x] == 0.0:
+                toolpath.extend(['Z+', 'Z-'])
+            if x == 0:
                 break
-            translate('Y-P', confirm)
-            y -= 1
+            toolpath.append('X-P')
+            x -= 1
+
+        if y == b - 1:
+            break
+        toolpath.append('Y+P')
+        y += 1
+
+    toolpath.extend(plan_line(x, y, 0, 0, diagonal))
+    return toolpath
+
+def plan_image_better_better(img, diagonal=True):
+    '''Toolpath of ``print_image_better_better``.
+
+    Parameters
+    ----------
+    img : array of floats
+        2-d array representation of the image, as set by ``prepare_img``.
+    diagonal : boolean, optional
+        Return to the HOME position with diagonal translations (default is
+        ``True``, see ``plan_line``).
+
+    Returns
+    -------
+    toolpath : list of str
+        Sequence of *adm* codes (see ``translate``).
+    '''
+    b, w = img.shape
+    toolpath = []
+
+    x = y = 0   # We are at HOME position.
+    while True:
+
+        # To the right.
+        while True:
+            if img[y][x] == 0.0:
+                toolpath.append('Z+')
+            if x + 1 < w and img[y][x+1] != 0.0:
+                toolpath.append('Z-')
+            if x == w - 1:
+                toolpath.append('Z-')
+                break
+            toolpath.append('X+P')
+            x += 1
+
+        if y == b - 1:
+            toolpath.append('Z-')
+            break
+        toolpath.append('Y+P')
+        y += 1
+
+        # To the left.
         while True:
+            if img[y][x] == 0.0:
+                toolpath.append('Z+')
+            if img[y][x-1] != 0.0:
+                toolpath.append('Z-')
             if x == 0:
+                toolpath.append('Z-')
                 break
-            translate('X-P', confirm)
+            toolpath.append('X-P')
             x -= 1
 
-        print 'The image has been printed'
+        if y == b - 1:
+            toolpath.append('Z-')
+            break
+        toolpath.append('Y+P')
+        y += 1
+
+    toolpath.extend(plan_line(x, y, 0, 0, diagonal))
+    return toolpath
+
+def overlap_z(toolpath):
+    '''Combine :math:`Z` translations with the adjacent pixel translations.
+
+    A ``'Z-'`` followed by a pixel translation is replaced by a subroutine
+    that starts the translation as soon as the tool is clear of the paper
+    instead of waiting for the servo to stop and settle, and a pixel
+    translation followed by ``'Z+'`` is replaced by a subroutine that starts
+    moving the tool down during the last transitions of the translation (see
+    ``Z_TIMING``).  :math:`Z` translations to the position the tool is
+    already in are dropped first.  The resulting toolpath deposits the same
+    pixels.
+
+    Parameters
+    ----------
+    toolpath : sequence of str
+        Sequence of *adm* codes (see ``translate``), starting with the tool
+        off.
+
+    Returns
+    -------
+    toolpath : list of str
+    '''
+    needed = []
+    z = 'Z-'
+    for adm in toolpath:
+        if adm in ('Z+', 'Z-'):
+            if adm == z:
+                continue
+            z = adm
+        needed.append(adm)
+    toolpath = needed
+
+    fused = []
+    i = 0
+    while i < len(toolpath):
+        adm = toolpath[i]
+        following = toolpath[i+1] if i + 1 < len(toolpath) else None
+        if adm == 'Z-' and following in FUSED_PIXEL_TRANSLATIONS:
+            fused.append(adm + following)
+            i += 2
+        elif adm in FUSED_PIXEL_TRANSLATIONS and following == 'Z+':
+            fused.append(adm + following)
+            i += 2
+        else:
+            fused.append(adm)
+            i += 1
+    return fused
+
+def transpose_toolpath(toolpath):
+    '''Swap the :math:`X` and :math:`Y` axes of a toolpath.
+
+    Parameters
+    ----------
+    toolpath : sequence of str
+        Sequence of *adm* codes (see ``translate``).
+
+    Returns
+    -------
+    toolpath : list of str
+    '''
+    by_effect = dict((effect, adm) for adm, effect in SIMULATION_ADMS.items())
+    transposed = dict((adm, by_effect[(dy, dx, z)])
+                      for adm, (dx, dy, z) in SIMULATION_ADMS.items())
+    return [transposed[adm] for adm in toolpath]
+
+def ink_runs(line):
+    '''Runs of consecutive pixels to print in a row of the image.
+
+    Parameters
+    ----------
+    line : array of booleans
+        ``True`` for the pixels to print.
+
+    Returns
+    -------
+    starts, ends : arrays of ints
+        First and last (inclusive) index of each run.
+    '''
+    padded = np.concatenate(([0], line.astype(np.int8), [0]))
+    edges = np.diff(padded)
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1) - 1
+
+def plan_scan(img, axis='row', serpentine=True, strokes=True, diagonal=True):
+    '''Toolpath that prints the image one line (row or column) at a time.
+
+    Along each line the tool is on across every run of consecutive pixels to
+    print and off between runs.
+
+    Parameters
+    ----------
+    img : array of floats
+        2-d array representation of the image, as set by ``prepare_img``.
+    axis : {``'row'``, ``'column'``}, optional
+        Scan along rows (:math:`X`) or along columns (:math:`Y`) (default is
+        ``'row'``).
+    serpentine : boolean, optional
+        Alternate the direction of consecutive lines, otherwise every line is
+        scanned in the positive direction (default is ``True``).
+    strokes : boolean, optional
+        Only visit the lines with pixels to print, from their first to their
+        last pixel to print, going straight from one line to the next.
+        Otherwise every line is scanned across the whole image, like a raster
+        (default is ``True``).
+    diagonal : boolean, optional
+        Use diagonal translations between lines (default is ``True``, see
+        ``plan_line``).
+
+    Returns
+    -------
+    toolpath : list of str
+        Sequence of *adm* codes (see ``translate``).
+    '''
+    if axis == 'column':
+        return transpose_toolpath(plan_scan(img.T, 'row', serpentine, strokes,
+                                            diagonal))
+
+    mask = img == 0.0
+    b, w = mask.shape
+    toolpath = []
+    x = y = 0   # We are at HOME position.
+    forward = True
+    for row in range(b):
+        starts, ends = ink_runs(mask[row])
+        if strokes and len(starts) == 0:
+            continue
+        if strokes:
+            lo, hi = starts[0], ends[-1]
+        else:
+            lo, hi = 0, w - 1
+
+        if forward:
+            adm, entry, exit = 'X+P', lo, hi
+            runs = zip(starts, ends)
+        else:
+            adm, entry, exit = 'X-P', hi, lo
+            runs = zip(ends[::-1], starts[::-1])
+
+        toolpath.extend(plan_line(x, y, entry, row, diagonal))
+        x, y = entry, row
+        for first, last in runs:
+            toolpath.extend([adm] * abs(first - x))
+            toolpath.append('Z+')
+            toolpath.extend([adm] * abs(last - first))
+            toolpath.append('Z-')
+            x = last
+        toolpath.extend([adm] * abs(exit - x))
+        x = exit
+
+        if serpentine:
+            forward = not forward
+
+    toolpath.extend(plan_line(x, y, 0, 0, diagonal))
+    return toolpath
+
+def translation_times(script=None):
+    '''Execution time of the translations on the MM12 emulator.
+
+    Parameters
+    ----------
+    script : str, optional
+        MM12 script (default is the script generated by ``mm12_script`` with
+        ``MM12_PROFILE``).
+
+    Returns
+    -------
+    times : dict
+        Seconds of a pixel translation along one axis (``'P'``) and
+        diagonal (``'D'``), of moving the tool on (``'Z+'``) and off
+        (``'Z-'``), and of the combined subroutines that
+        move the tool off and then translate it one pixel (``'Z-P'``) and
+        translate it one pixel and then move it on (``'PZ+'``), see
+        ``overlap_z``, and of a transition of the ``JOG_TRANSLATIONS``
+        (``'j'``).
+    '''
+    if script is None:
+        script = mm12_script(**MM12_PROFILE)
+    emulator = MM12Emulator(script)
+    emulator.write(mm12_command('Z-'))
+    times = {}
+    for adm in ('X+P', 'X+Y+P', 'Z+', 'Z-'):
+        start = emulator.clock
+        emulator.write(mm12_command(adm))
+        times[adm] = emulator.clock - start
+    times['P'] = times.pop('X+P')
+    times['D'] = times.pop('X+Y+P')
+    start = emulator.clock
+    emulator.write(mm12_command('X+j', TRANSITIONS_PER_PIXEL))
+    times['j'] = (emulator.clock - start) / TRANSITIONS_PER_PIXEL
+    times['Z-P'] = (emulate_toolpath(['Z-', 'Z+', 'Z-X+P'], script)
+                    - emulate_toolpath(['Z-', 'Z+'], script))
+    times['PZ+'] = (emulate_toolpath(['Z-', 'X+PZ+'], script)
+                    - emulate_toolpath(['Z-'], script))
+    return times
+
+def estimate_scan_cost(img, axis='row', serpentine=True, strokes=True,
+                       diagonal=True, times=None):
+    '''Estimate the cost of the toolpath of ``plan_scan`` without planning
+    it.
+
+    Only array operations over the whole image are used, so the estimate is
+    much faster than planning.  The counts are exact.
+
+    Parameters
+    ----------
+    img : array of floats
+        2-d array representation of the image, as set by ``prepare_img``.
+    axis, serpentine, strokes, diagonal : optional
+        See ``plan_scan``.
+    times : dict, optional
+        Time of the translations (default is the result of
+        ``translation_times``).
+
+    Returns
+    -------
+    cost : dict
+        Number of pixel translations (``moves``), of which ``diagonal``,
+        :math:`Z` translations (``z``), total translations (``commands``)
+        and modeled ``seconds``, including ``MM12_COMMAND_LATENCY`` per
+        translation.
+    '''
+    if times is None:
+        times = translation_times()
+    mask = img == 0.0
+    if axis == 'column':
+        mask = mask.T
+    b, w = mask.shape
+
+    padded = np.zeros((b, w + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    nruns = (np.diff(padded, axis=1) == 1).sum(axis=1)
+    first = np.argmax(mask, axis=1)
+    last = w - 1 - np.argmax(mask[:, ::-1], axis=1)
+
+    if strokes:
+        rows = np.flatnonzero(nruns)
+        lo, hi = first[rows], last[rows]
+    else:
+        rows = np.arange(b)
+        lo, hi = np.zeros(b, dtype=int), np.full(b, w - 1, dtype=int)
+
+    if serpentine:
+        forward = np.arange(len(rows)) % 2 == 0
+    else:
+        forward = np.ones(len(rows), dtype=bool)
+    entry = np.where(forward, lo, hi)
+    exit = np.where(forward, hi, lo)
+
+    # Translations between lines, from HOME and back to HOME.
+    dx = np.abs(np.concatenate((entry, [0])) - np.concatenate(([0], exit)))
+    dy = np.abs(np.concatenate((rows, [0])) - np.concatenate(([0], rows)))
+    travel = np.maximum(dx, dy) if diagonal else dx + dy
+    # plan_line takes the shorter side diagonally.
+    ndiagonal = int(np.minimum(dx, dy).sum()) if diagonal else 0
+
+    moves = int((hi - lo).sum() + travel.sum())
+    nz = 2 * int(nruns.sum())
+    commands = moves + nz
+    seconds = ((moves - ndiagonal) * times['P'] + ndiagonal * times['D']
+               + nz // 2 * (times['Z+'] + times['Z-'])
+               + commands * MM12_COMMAND_LATENCY)
+    return {'moves' : moves, 'diagonal' : ndiagonal, 'z' : nz,
+            'commands' : commands, 'seconds' : seconds}
+
+def rank_scan_strategies(img, diagonal=True, times=None):
+    '''Modeled cost of every ``plan_scan`` strategy for the image.
+
+    Every combination of scan axis (row, column), order (serpentine,
+    unidirectional) and mode (strokes, raster) is evaluated with
+    ``estimate_scan_cost``.
+
+    Parameters
+    ----------
+    img : array of floats
+        2-d array representation of the image, as set by ``prepare_img``.
+    diagonal : boolean, optional
+        Use diagonal translations (default is ``True``, see ``plan_line``).
+    times : dict, optional
+        Time of the translations (default is the result of
+        ``translation_times``).
+
+    Returns
+    -------
+    candidates : list of tuples
+        ``(seconds, name, cost, (axis, serpentine, strokes))`` from the
+        cheapest, *cost* as returned by ``estimate_scan_cost``.
+    '''
+    if times is None:
+        times = translation_times()
+    candidates = []
+    for axis in ('row', 'column'):
+        for serpentine in (True, False):
+            for strokes in (True, False):
+                name = '{0}-{1}-{2}'.format(
+                    axis, 'serpentine' if serpentine else 'unidirectional',
+                    'strokes' if strokes else 'raster')
+                cost = estimate_scan_cost(img, axis, serpentine, strokes,
+                                          diagonal, times)
+                candidates.append((cost['seconds'], name, cost,
+                                   (axis, serpentine, strokes)))
+    candidates.sort()
+    return candidates
+
+def plan_auto(img, diagonal=True, times=None):
+    '''Toolpath of the cheapest ``plan_scan`` strategy for the image.
+
+    The strategies are ranked with ``rank_scan_strategies`` and the one with
+    the least modeled time is planned.  The comparison is printed and
+    logged.
+
+    Parameters
+    ----------
+    img : array of floats
+        2-d array representation of the image, as set by ``prepare_img``.
+    diagonal : boolean, optional
+        Use diagonal translations (default is ``True``, see ``plan_line``).
+    times : dict, optional
+        Time of the translations (default is the result of
+        ``translation_times``).
+
+    Returns
+    -------
+    toolpath : list of str
+        Sequence of *adm* codes (see ``translate``).
+    '''
+    candidates = rank_scan_strategies(img, diagonal, times)
+
+    lines = ['Scan strategies for a {0}x{1} image:'.format(*img.shape)]
+    lines.append('  {0:<30} {1:>8} {2:>8} {3:>10}'.format(
+        'strategy', 'moves', 'Z', 'seconds'))
+    for seconds, name, cost, args in candidates:
+        lines.append('  {0:<30} {1:>8} {2:>8} {3:>10.1f}'.format(
+            name, cost['moves'], cost['z'], seconds))
+    best, runner_up = candidates[0], candidates[1]
+    lines.append('Chose {0}: {1:.1f} s modeled, {2:.1f} s less than {3} '
+                 '({4} fewer moves, {5} fewer Z translations)'.format(
+                     best[1], best[0], runner_up[0] - best[0], runner_up[1],
+                     runner_up[2]['moves'] - best[2]['moves'],
+                     runner_up[2]['z'] - best[2]['z']))
+    for line in lines:
+        print line
+    if 'logf' in globals():
+        for line in lines:
+            print >>logf, line
+
+    axis, serpentine, strokes = best[3]
+    return plan_scan(img, axis, serpentine, strokes, diagonal)
+
+def changed_regions(mask, gap=4):
+    '''Bounding boxes enclosing the pixels of a mask.
+
+    Bands of consecutive rows with pixels set are split into bands of
+    consecutive columns with pixels set within the row band, and the boxes
+    are shrunk to the pixels they enclose.  Bands separated by no more than
+    *gap* pixels are merged, as every box costs a trip back to its top left
+    corner.
+
+    Parameters
+    ----------
+    mask : array of booleans
+        2-d array, ``True`` for the pixels to enclose.
+    gap : int, optional
+        Largest gap, in pixels, between merged bands (default is 4).
+
+    Returns
+    -------
+    regions : list of tuples
+        ``(top, left, bottom, right)`` boxes, bottom and right inclusive, in
+        row-major order.
+    '''
+    def bands(line):
+        starts, ends = ink_runs(line)
+        breaks = np.flatnonzero(starts[1:] - ends[:-1] > gap + 1)
+        return zip(np.concatenate((starts[:1], starts[breaks + 1])),
+                   np.concatenate((ends[breaks], ends[-1:])))
+
+    regions = []
+    for top, bottom in bands(mask.any(axis=1)):
+        band = mask[top:bottom + 1]
+        for left, right in bands(band.any(axis=0)):
+            rows = np.flatnonzero(band[:, left:right + 1].any(axis=1))
+            regions.append((top + rows[0], left, top + rows[-1], right))
+    return regions
+
+def plan_delta(previous, img, planner=plan_auto):
+    '''Toolpath that prints only the pixels of the image that are not already
+    printed on the sheet.
+
+    The pixels to print are enclosed by ``changed_regions`` and each region
+    is planned with *planner* as an image of its own, so the toolpath scales
+    with the size of the change rather than the size of the image.  With
+    ``plan_auto`` the translation times are modeled once and the strategies
+    chosen for the regions are reported once.
+
+    Parameters
+    ----------
+    previous : array of floats
+        2-d array representation of the image already printed on the sheet
+        (see ``load_img``).
+    img : array of floats
+        2-d array representation of the image, as set by ``prepare_img``.
+    planner : callable, optional
+        One of ``PLANNERS`` (default is ``plan_auto``).
+
+    Returns
+    -------
+    toolpath : list of str
+        Sequence of *adm* codes (see ``translate``).
+    delta : array of floats
+        2-d array representation of the pixels to print.
+    regions : list of tuples
+        Boxes planned, see ``changed_regions``.
+
+    Raises
+    ------
+    ValueError
+        If the images don't have the same shape.
+
+    Notes
+    -----
+    Pixels printed before that are not printed in *img* can't be erased,
+    they are counted and reported.
+    '''
+    if previous.shape != img.shape:
+        raise ValueError('Previous image is {0}x{1}, expected {2}x{3}'.format(
+                         *(previous.shape + img.shape)))
+
+    new_ink = (img == 0.0) & (previous != 0.0)
+    stale = int(np.count_nonzero((previous == 0.0) & (img != 0.0)))
+    if stale:
+        print 'Warning: {0} pixels printed before are not in the new ' \
+              'image and will remain printed'.format(stale)
+
+    delta = np.where(new_ink, 0.0, 1.0)
+    regions = changed_regions(new_ink)
+    chosen = {}
+    if planner is plan_auto:
+        times = translation_times()
+
+        def planner(region):
+            best = rank_scan_strategies(region, times=times)[0]
+            chosen[best[1]] = chosen.get(best[1], 0) + 1
+            return plan_scan(region, *best[3])
+
+    toolpath = []
+    x = y = 0   # We are at HOME position.
+    for top, left, bottom, right in regions:
+        toolpath.extend(plan_line(x, y, left, top))
+        # The planners start and end at the top left corner of the region.
+        toolpath.extend(planner(delta[top:bottom + 1, left:right + 1]))
+        x, y = left, top
+    toolpath.extend(plan_line(x, y, 0, 0))
+
+    print 'Delta of {0} pixels in {1} regions covering {2} of {3} ' \
+          'pixels'.format(int(np.count_nonzero(new_ink)), len(regions),
+                          sum((bottom - top + 1) * (right - left + 1)
+                              for top, left, bottom, right in regions),
+                          img.size)
+    if chosen:
+        line = 'Regions planned by plan_auto: {0}'.format(', '.join(
+            '{0} {1}'.format(name, count)
+            for name, count in sorted(chosen.items())))
+        print line
+        if 'logf' in globals():
+            print >>logf, line
+    return toolpath, delta, regions
+
+def pack_rectangles(sizes, width):
+    '''Place rectangles on a strip of fixed width and unbounded height.
+
+    Rectangles are placed from the tallest to the shortest, each at the
+    lowest position of the skyline (the height of the strip already used by
+    each column), leftmost on ties.
+
+    Parameters
+    ----------
+    sizes : sequence of tuples
+        ``(height, width)`` of each rectangle.
+    width : int
+        Width of the strip.
+
+    Returns
+    -------
+    positions : list of tuples
+        ``(top, left)`` of each rectangle, in the order of *sizes*.
+    height : int
+        Height of the strip used.
+
+    Raises
+    ------
+    ValueError
+        If a rectangle is wider than the strip.
+    '''
+    skyline = np.zeros(width, dtype=int)
+    positions = [None] * len(sizes)
+    order = sorted(range(len(sizes)), key=lambda i: (-sizes[i][0], -sizes[i][1]))
+    for i in order:
+        height, rwidth = sizes[i]
+        if rwidth > width:
+            raise ValueError('An image {0} pixels wide does not fit in a '
+                             'sheet {1} pixels wide'.format(rwidth, width))
+        windows = np.lib.stride_tricks.as_strided(
+            skyline, shape=(width - rwidth + 1, rwidth),
+            strides=skyline.strides * 2)
+        tops = windows.max(axis=1)
+        left = int(np.argmin(tops))
+        top = int(tops[left])
+        skyline[left:left + rwidth] = top + height
+        positions[i] = (top, left)
+    return positions, int(skyline.max())
+
+def crop_to_ink(img):
+    '''Crop an image to the bounding box of its pixels to print.
+
+    Parameters
+    ----------
+    img : array of floats
+        2-d array representation of the image (see ``load_img``).
+
+    Returns
+    -------
+    img : array of floats
+    '''
+    mask = img == 0.0
+    rows = np.flatnonzero(mask.any(axis=1))
+    columns = np.flatnonzero(mask.any(axis=0))
+    return img[rows[0]:rows[-1] + 1, columns[0]:columns[-1] + 1]
+
+def nest_images(imgs, copies=None, sheet_width=None, gap=1):
+    '''Pack copies of several images onto one sheet.
+
+    The images are cropped to their pixels to print (see ``crop_to_ink``)
+    and placed with ``pack_rectangles``.
+
+    Parameters
+    ----------
+    imgs : sequence of arrays of floats
+        2-d array representation of the images (see ``load_img``).
+    copies : sequence of int, optional
+        Number of copies of each image (default is one of each).
+    sheet_width : int, optional
+        Width of the sheet, in pixels (default is the width of a square
+        sheet with the area of the images, or the widest image).
+    gap : int, optional
+        Blank pixels between images (default is 1).
+
+    Returns
+    -------
+    sheet : array of floats
+        2-d array representation of the sheet, its top left corner is the
+        HOME position.
+    placements : list of tuples
+        ``(image, top, left)`` of every copy, *image* is the index in
+        *imgs*.
+    utilization : float
+        Fraction of the sheet covered by the (cropped) images.
+    '''
+    if copies is None:
+        copies = [1] * len(imgs)
+    imgs = [crop_to_ink(img) for img in imgs]
+    index = [i for i, n in enumerate(copies) for copy in range(n)]
+    # Every image is padded with the gap on the right and bottom sides.
+    sizes = [(imgs[i].shape[0] + gap, imgs[i].shape[1] + gap) for i in index]
+    if sheet_width is None:
+        area = sum(height * width for height, width in sizes)
+        sheet_width = max(int(np.ceil(np.sqrt(area))) - gap,
+                          max(width for height, width in sizes) - gap)
+
+    positions, height = pack_rectangles(sizes, sheet_width + gap)
+    sheet = np.ones((height - gap, sheet_width))
+    placements = []
+    for i, (top, left) in zip(index, positions):
+        rows, columns = imgs[i].shape
+        sheet[top:top + rows, left:left + columns] = imgs[i]
+        placements.append((i, top, left))
+    utilization = sum(imgs[i].size for i in index) / sheet.size
+    return sheet, placements, utilization
+
+PLANNERS = {
+    'print_image'               : plan_image,
+    'print_image_better'        : plan_image_better,
+    'print_image_better_better' : plan_image_better_better,
+    'auto'                      : plan_auto,
+}
+'''Toolpath planners by name, each one takes the image array and returns a
+toolpath.'''
+
+def plan_nested(sheet, imgs, copies, placements, utilization,
+                planner=plan_auto):
+    '''Toolpath of a sheet of nested images (see ``nest_images``).
+
+    Two toolpaths are compared with ``toolpath_seconds`` and the fastest is
+    returned: the whole sheet planned as one image, and each image planned
+    once and repeated at every placement, visiting the placements in
+    nearest neighbor order.
+
+    Parameters
+    ----------
+    sheet : array of floats
+        2-d array representation of the sheet.
+    imgs : sequence of arrays of floats
+        2-d array representation of the images, before cropping.
+    copies, placements, utilization
+        See ``nest_images``.
+    planner : callable, optional
+        One of ``PLANNERS`` (default is ``plan_auto``).
+
+    Returns
+    -------
+    toolpath : list of str
+        Sequence of *adm* codes (see ``translate``).
+    report : dict
+        *placements* and *utilization*, the *layout* chosen (``'sheet'`` or
+        ``'placements'``), modeled *seconds* of the job and
+        *sequential_seconds* of printing every copy as a job of its own, both
+        including ``JOB_SETUP_TIME`` per job.
+    '''
+    if copies is None:
+        copies = [1] * len(imgs)
+    times = translation_times()
+    sequential = sum(ncopies * (JOB_SETUP_TIME
+                                + toolpath_seconds(planner(jobimg), times))
+                     for jobimg, ncopies in zip(imgs, copies))
+
+    plans = dict((i, planner(crop_to_ink(imgs[i])))
+                 for i in set(i for i, top, left in placements))
+    toolpath = []
+    x = y = 0   # We are at HOME position.
+    left_to_visit = list(placements)
+    while left_to_visit:
+        nearest = min(left_to_visit, key=lambda (i, top, left): max(
+            abs(left - x), abs(top - y)))
+        left_to_visit.remove(nearest)
+        i, y1, x1 = nearest
+        toolpath.extend(plan_line(x, y, x1, y1))
+        # The planners start and end at the top left corner of the image.
+        toolpath.extend(plans[i])
+        x, y = x1, y1
+    toolpath.extend(plan_line(x, y, 0, 0))
+
+    layouts = [(toolpath_seconds(toolpath, times), 'placements', toolpath)]
+    toolpath = planner(sheet)
+    layouts.append((toolpath_seconds(toolpath, times), 'sheet', toolpath))
+    seconds, layout, toolpath = min(layouts)
+    seconds += JOB_SETUP_TIME
+
+    print 'Nested job planned by {0}: {1:.0f} s modeled, {2:.0f} s less ' \
+          'than printing the copies one by one'.format(layout, seconds,
+                                                       sequential - seconds)
+    return toolpath, {
+        'placements'         : [map(int, placement) for placement in placements],
+        'utilization'        : utilization,
+        'layout'             : layout,
+        'seconds'            : seconds,
+        'sequential_seconds' : sequential,
+    }
+
+def simulate_toolpath(toolpath, shape):
+    '''Execute a toolpath against a virtual canvas.
+
+    The whole toolpath is evaluated with array operations, so simulating
+    large jobs takes a fraction of a second per million translations.
+
+    Parameters
+    ----------
+    toolpath : sequence of str
+        Sequence of *adm* codes (see ``translate``), starting from the HOME
+        position with the tool off.
+    shape : tuple
+        ``(b, w)`` shape of the canvas.
+
+    Returns
+    -------
+    deposited : array of booleans
+        Pixels the tool touched while on.
+    travel : array of booleans
+        Pixels the tool went across while off.
+    outside : int
+        Number of positions that fell outside the canvas.
+    end : tuple
+        ``(x, y)`` final position of the tool, in pixels.
+    '''
+    adms = list(SIMULATION_ADMS)
+    index = dict((adm, i) for i, adm in enumerate(adms))
+    codes = np.fromiter((index[adm] for adm in toolpath), dtype=np.intp,
+                        count=len(toolpath))
+    table = np.array([SIMULATION_ADMS[adm] for adm in adms], dtype=np.intp)
+    # Prepend the HOME position with the tool off.
+    steps = np.vstack(([[0, 0, -1]], table[codes]))
+
+    # Positions are accumulated in low-to-high transitions so single pulses
+    # are accounted for, then reduced to pixels.
+    x = np.cumsum(steps[:, 0]) // TRANSITIONS_PER_PIXEL
+    y = np.cumsum(steps[:, 1]) // TRANSITIONS_PER_PIXEL
+
+    # The tool state after each translation is the last Z translation so far.
+    z = steps[:, 2]
+    last_z = np.maximum.accumulate(np.where(z != 0, np.arange(len(z)), 0))
+    tool_on = z[last_z] > 0
+
+    b, w = shape
+    inside = (x >= 0) & (x < w) & (y >= 0) & (y < b)
+    deposited = np.zeros(shape, dtype=bool)
+    travel = np.zeros(shape, dtype=bool)
+    deposited[y[inside & tool_on], x[inside & tool_on]] = True
+    travel[y[inside & ~tool_on], x[inside & ~tool_on]] = True
+    return deposited, travel, int(np.count_nonzero(~inside)), (int(x[-1]),
+                                                               int(y[-1]))
+
+def toolpath_seconds(toolpath, times=None):
+    '''Modeled printing time of a toolpath.
+
+    Parameters
+    ----------
+    toolpath : sequence of str
+        Sequence of *adm* codes (see ``translate``).
+    times : dict, optional
+        Time of the translations (default is the result of
+        ``translation_times``).
+
+    Returns
+    -------
+    seconds : float
+        Sum of the times of the pixel and :math:`Z` translations of every
+        *adm* code plus ``MM12_COMMAND_LATENCY`` per translation, diagonal
+        pixel translations take ``times['D']``.  The combined subroutines
+        (see ``overlap_z``) take the emulated time of the overlapped
+        translations if *times* has it, plus the extra time of a diagonal
+        pixel.
+    '''
+    if times is None:
+        times = translation_times()
+    counts = {}
+    for adm in toolpath:
+        counts[adm] = counts.get(adm, 0) + 1
+    seconds = 0.0
+    for adm, count in counts.items():
+        dx, dy, z = SIMULATION_ADMS[adm]
+        pixel = times['D'] if dx and dy else times['P']
+        fused = 'Z-P' if adm.startswith('Z-') else 'PZ+'
+        if (dx or dy) and z and fused in times:
+            seconds += count * (MM12_COMMAND_LATENCY + times[fused]
+                                + pixel - times['P'])
+            continue
+        seconds += count * (MM12_COMMAND_LATENCY
+                            + (pixel if dx or dy else 0.0)
+                            + (times['Z+'] if z > 0 else 0.0)
+                            + (times['Z-'] if z < 0 else 0.0))
+    return seconds
+
+def render_toolpath(toolpath, img, fpath=None, scale=1):
+    '''Dry run a toolpath, compare the result with the image and optionally
+    render it to a PNG file.
+
+    In the rendered image the deposited pixels are black and the rest of the
+    pixels the tool went across are light blue.  Pixels that differ from the
+    image are red (missing) or orange (deposited but not in the image).
+
+    Parameters
+    ----------
+    toolpath : sequence of str
+        Sequence of *adm* codes (see ``translate``).
+    img : array of floats
+        2-d array representation of the image, as set by ``prepare_img``.
+    fpath : str-like, optional
+        Path where to save the PNG file (default is ``None``, not rendered).
+    scale : int, optional
+        Size in pixels of the side of each rendered image pixel (default is
+        1).
+
+    Returns
+    -------
+    report : dict
+        Number of ``deposited``, ``missing`` and ``extra`` pixels,
+        ``outside`` positions, whether the result is ``exact`` and whether the
+        tool ended at ``home``.
+    '''
+    deposited, travel, outside, end = simulate_toolpath(toolpath, img.shape)
+    target = img == 0.0
+    missing = target & ~deposited
+    extra = deposited & ~target
+
+    if fpath is not None:
+        import matplotlib.image as mpimg
+        canvas = np.ones(img.shape + (3,))
+        canvas[travel] = (0.7, 0.85, 1.0)
+        canvas[deposited] = (0.0, 0.0, 0.0)
+        canvas[missing] = (1.0, 0.0, 0.0)
+        canvas[extra] = (1.0, 0.6, 0.0)
+        canvas = canvas.repeat(scale, axis=0).repeat(scale, axis=1)
+        mpimg.imsave(fpath, canvas, format='png')
+
+    nmissing = int(np.count_nonzero(missing))
+    nextra = int(np.count_nonzero(extra))
+    return {
+        'deposited' : int(np.count_nonzero(deposited)),
+        'missing'   : nmissing,
+        'extra'     : nextra,
+        'outside'   : outside,
+        'exact'     : nmissing == nextra == outside == 0,
+        'home'      : end == (0, 0),
+    }
+
+class Progress(object):
+    '''Progress of a toolpath being printed, rendered from a background thread.
+
+    ``update`` is meant to be called from the print loop after every
+    translation and only records the state, the rendering (and the live
+    preview, if any) is done every *interval* seconds by a background thread
+    so it doesn't slow down the translations.  Use it as a context manager::
+
+        with Progress(len(toolpath)) as progress:
+            print_toolpath(toolpath, report=progress.update)
+
+    Parameters
+    ----------
+    total : int
+        Number of translations of the toolpath.
+    shape : tuple, optional
+        ``(b, w)`` shape of the image, needed for the live preview.
+    preview : str-like, optional
+        Path of a PNG file where the pixels printed so far are periodically
+        written.
+    interval : float, optional
+        Seconds between renderings (default is ``PROGRESS_INTERVAL``).
+    render : callable, optional
+        Called as ``render(progress)`` every *interval* seconds and once more
+        when finished.  By default a progress bar with the rate and estimated
+        time of arrival is drawn on *stream*.
+    stream : file-like, optional
+        Where to draw the progress bar (default is ``sys.stdout``).
+    '''
+    def __init__(self, total, shape=None, preview=None,
+                 interval=PROGRESS_INTERVAL, render=None, stream=None):
+        self.total = total
+        self.done = 0
+        self.x = self.y = 0
+        self.preview = preview
+        self.interval = interval
+        self.render = self.draw_bar if render is None else render
+        self.stream = sys.stdout if stream is None else stream
+        self.printed = None
+        if preview is not None:
+            self.printed = np.zeros(shape, dtype=bool)
+        self.pen_down = False
+        self.start = time.time()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def __enter__(self):
+        self.start = time.time()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+        self._refresh()
+        if self.render == self.draw_bar:
+            print >>self.stream
+
+    def update(self, i, adm, x, y):
+        '''Record that the *i*-th translation of the toolpath, *adm*, left the
+        tool at ``(x, y)`` (see ``print_toolpath``).'''
+        self.done = i + 1
+        self.x, self.y = x, y
+        if self.printed is not None:
+            z = SIMULATION_ADMS[adm][2]
+            if z:
+                self.pen_down = z > 0
+            if self.pen_down:
+                self.printed[y, x] = True
+
+    def rate(self):
+        '''Translations per second.'''
+        elapsed = time.time() - self.start
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def eta(self):
+        '''Estimated seconds left, ``None`` if unknown.'''
+        rate = self.rate()
+        if rate > 0:
+            return (self.total - self.done) / rate
+
+    def draw_bar(self, progress):
+        '''Draw a single line progress bar on the stream.'''
+        fraction = self.done / self.total if self.total else 1.0
+        nbar = int(30 * fraction)
+        eta = self.eta()
+        eta = '--:--:--' if eta is None else time.strftime('%H:%M:%S',
+                                                           time.gmtime(eta))
+        self.stream.write(
+            '\r[{0}{1}] {2:5.1f}% {3}/{4} moves {5:6.1f} moves/s ETA {6}'.format(
+                '#' * nbar, '.' * (30 - nbar), 100 * fraction, self.done,
+                self.total, self.rate(), eta))
+        self.stream.flush()
+
+    def write_preview(self):
+        '''Write the pixels printed so far to the preview file.'''
+        import matplotlib.image as mpimg
+        mpimg.imsave(self.preview, ~self.printed, cmap='gray', vmin=0,
+                     vmax=1, format='png')
+
+    def _refresh(self):
+        self.render(self)
+        if self.preview is not None:
+            self.write_preview()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self._refresh()
+
+def print_toolpath(toolpath, confirm=False, report=None):
+    '''Drive printerm through a toolpath.
+
+    Parameters
+    ----------
+    toolpath : sequence of str
+        Sequence of *adm* codes (see ``translate``), starting from the HOME
+        position.
+    confirm : boolean, optional
+        Wait for confirmation before any translation (default is ``False``).
+    report : callable, optional
+        Called as ``report(i, adm, x, y)`` after the *i*-th translation has
+        been sent, where ``(x, y)`` is the tool position in pixels.  It is
+        called in the print loop, so it must return quickly (see
+        ``Progress``).  By default a progress bar is drawn.
+
+    Returns
+    -------
+    completed : boolean
+        ``False`` if the operation was interrupted by the user.
+    '''
+    if report is None:
+        with Progress(len(toolpath)) as progress:
+            return print_toolpath(toolpath, confirm, progress.update)
+
+    try:
+        x = y = 0   # We are at HOME position.
+        for i, adm in enumerate(toolpath):
+            translate(adm, confirm)
+            dx, dy = ADM_PIXEL_DELTAS.get(adm, (0, 0))
+            x += dx
+            y += dy
+            report(i, adm, x, y)
 
     except KeyboardInterrupt:
         sp.flush()
         print 'Operation interrupted, flushing command port'
+        return False
+
+    return True
+
+def print_img(planner, confirm=False, preview=None):
+    '''Print the image loaded by ``prepare_img`` with the toolpath produced by
+    *planner*, showing the progress (see ``Progress``).'''
+    msg = 'Preparing to print an image with {0} rows and {1} columns'.format(b,
+                                                                             w)
+    print msg
+
+    toolpath = planner(img)
+    with Progress(len(toolpath), img.shape, preview) as progress:
+        completed = print_toolpath(toolpath, confirm, progress.update)
+    if completed:
+        print 'The image has been printed'
+
+def print_image(confirm=False, preview=None):
+    '''Print the input image one row at a time, always from left to right,
+    returning to the first column after every row.
 
-def print_image_better_better(confirm=False):
+    Parameters
+    ----------
+
+    confirm : boolean, optional
+        Wait for confirmation before any translation (default is ``False``).
+    preview : str-like, optional
+        Path of a PNG file updated with the pixels printed so far (default is
+        ``None``, no preview).
+    '''
+    print_img(plan_image, confirm, preview)
+
+def print_image_better(confirm=False, preview=None):
+    '''Print the input image visiting the rows alternately from left to right
+    and from right to left.  Every pixel is printed as an individual dot.
+
+    Parameters
+    ----------
+
+    confirm : boolean, optional
+        Wait for confirmation before any translation (default is ``False``).
+    preview : str-like, optional
+        Path of a PNG file updated with the pixels printed so far (default is
+        ``None``, no preview).
+    '''
+    print_img(plan_image_better, confirm, preview)
+
+def print_image_better_better(confirm=False, preview=None):
     '''Automatically print the input image.
 
     Parameters
@@ -723,6 +3362,9 @@ def print_image_better_better(confirm=False):
 
     confirm : boolean, optional
         Wait for confirmation before any translation (default is ``False``).
+    preview : str-like, optional
+        Path of a PNG file updated with the pixels printed so far (default is
+        ``None``, no preview).
 
     Notes
     -----
@@ -744,94 +3386,1022 @@ def print_image_better_better(confirm=False):
     the tool prints it.
 
     '''
-    def report_position(x, y):
-        print 'At row {0}, column {1}'.format(y, x)
+    print_img(plan_image_better_better, confirm, preview)
 
-    def print_img_pixel(x, y, confirm=False):
-        if img[y][x] == 0.0:
-            print_pixel(confirm)
+def emit_event(stream, event, **fields):
+    '''Write a machine-readable progress event as a single line of JSON.
 
-    def color_in_this_row(row):
-        for pixel in row:
-            if pixel == 0.0:
-                return True
-        return False
+    Parameters
+    ----------
+    stream : file-like
+        Where to write the event.
+    event : str
+        Name of the event.
+    fields
+        Additional members of the event object.
+    '''
+    fields['event'] = event
+    fields['time'] = time.time()
+    print >>stream, json.dumps(fields, sort_keys=True)
+    stream.flush()
 
-    try:
+class ToolpathCache(object):
+    '''On-disk cache of planned toolpaths with least recently used eviction.
 
-        msg = 'Preparing to print an image with {0} rows and {1} columns'.format(b,
-                                                                                 w)
-        print msg
+    Entries are keyed by the contents of the image files and the options
+    that change the toolpath (see ``key``), so a job that was planned before
+    is printed without loading the image or planning it again.  The hit, miss
+    and eviction counts are kept in ``stats.json`` in the cache directory.
 
-        x = y = z = 0   # We are at HOME position.
-        while True:
+    Parameters
+    ----------
+    directory : str-like, optional
+        Cache directory, created if needed (default is
+        ``TOOLPATH_CACHE_DIR``).
+    max_bytes : int, optional
+        Size limit of the cached entries, the least recently used are evicted
+        when it is exceeded (default is ``TOOLPATH_CACHE_SIZE``).
+    '''
+    def __init__(self, directory=TOOLPATH_CACHE_DIR,
+                 max_bytes=TOOLPATH_CACHE_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.stats_path = os.path.join(directory, 'stats.json')
+        try:
+            with open(self.stats_path) as f:
+                self.stats = json.load(f)
+        except (IOError, ValueError):
+            self.stats = {'hits' : 0, 'misses' : 0, 'evictions' : 0}
+
+    def key(self, imgpath, invert=False, planner='print_image_better_better',
+            overlap=False, previous=None):
+        '''Cache key of a job, see ``run_jobs`` for the parameters.
+
+        The key also covers the MM12 script generated with the current
+        settings (see ``MM12_PROFILE``), ``Z_TIMING``, whose settle and
+        clearance times are sent with the commands but change the modeled
+        times ``plan_auto`` compares, and ``INK_THRESHOLD``.
+
+        Raises
+        ------
+        IOError
+            If an image file can't be read.
+        '''
+        digest = hashlib.sha1()
+        for path in (imgpath, previous):
+            if path is None:
+                digest.update('-')
+            else:
+                with open(path, 'rb') as f:
+                    digest.update(hashlib.sha1(f.read()).hexdigest())
+        digest.update(json.dumps({
+            'version'   : __version__,
+            'invert'    : bool(invert),
+            'planner'   : planner,
+            'overlap'   : bool(overlap),
+            'threshold' : INK_THRESHOLD,
+            'script'    : mm12_script(**MM12_PROFILE),
+            'z_timing'  : Z_TIMING,
+        }, sort_keys=True))
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.json.gz')
+
+    def get(self, key):
+        '''Cached entry for *key*, ``None`` on a miss.'''
+        path = self.path(key)
+        with self.lock:
+            try:
+                with gzip.open(path, 'rb') as f:
+                    entry = json.load(f)
+                os.utime(path, None)    # Most recently used.
+                self.stats['hits'] += 1
+            except (IOError, ValueError):
+                entry = None
+                self.stats['misses'] += 1
+            self._save_stats()
+        return entry
+
+    def put(self, key, entry):
+        '''Store *entry*, a JSON serializable dict, under *key*.'''
+        path = self.path(key)
+        tmppath = '{0}.{1}.tmp'.format(path, os.getpid())
+        with self.lock:
+            with gzip.open(tmppath, 'wb') as f:
+                json.dump(entry, f)
+            os.rename(tmppath, path)
+            self._evict()
+            self._save_stats()
+
+    def clear(self):
+        '''Remove every entry and reset the statistics.'''
+        with self.lock:
+            for name, size, mtime in self._entries():
+                os.remove(os.path.join(self.directory, name))
+            self.stats = {'hits' : 0, 'misses' : 0, 'evictions' : 0}
+            self._save_stats()
+
+    def info(self):
+        '''Statistics of the cache.
+
+        Returns
+        -------
+        info : dict
+            ``hits``, ``misses``, ``evictions``, ``hit_rate``, number of
+            ``entries`` and their size in ``bytes``.
+        '''
+        with self.lock:
+            entries = self._entries()
+            info = dict(self.stats)
+        lookups = info['hits'] + info['misses']
+        info['hit_rate'] = info['hits'] / lookups if lookups else 0.0
+        info['entries'] = len(entries)
+        info['bytes'] = sum(size for name, size, mtime in entries)
+        info['max_bytes'] = self.max_bytes
+        return info
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.json.gz'):
+                st = os.stat(os.path.join(self.directory, name))
+                entries.append((name, st.st_size, st.st_mtime))
+        return entries
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=operator.itemgetter(2))
+        total = sum(size for name, size, mtime in entries)
+        for name, size, mtime in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+            self.stats['evictions'] += 1
+
+    def _save_stats(self):
+        with open(self.stats_path, 'w') as f:
+            json.dump(self.stats, f)
+
+def run_jobs(imgpaths, commandport_id=None,
+             planner='print_image_better_better', invert=False,
+             dry_run=False, confirm=False, events=None, preview=None,
+             render=None, render_scale=1, overlap=False, previous=None,
+             cache=None, nest=None):
+    '''Prepare and print a sequence of images without operator intervention.
+
+    Jobs are run back-to-back, every job starts and ends at the HOME position.
+    Progress is reported as JSON lines (see ``emit_event``) with the events
+    ``planned``, ``progress`` (every ``PROGRESS_INTERVAL`` seconds),
+    ``finished``, ``interrupted`` and ``error``.
 
-            # To the right.
-            print 'Printing across the row {0}'.format(y)
-            while True:
-                report_position(x, y)
-                if img[y][x] == 0.0:
-                    translate('Z+', confirm)
-                try:
-                    if img[y][x+1] != 0.0:
-                        translate('Z-', confirm)
-                except IndexError as e:
-                    pass
-                if x == w - 1:
-                    translate('Z-')
-                    break
-                translate('X+P', confirm)
-                x += 1
+    Parameters
+    ----------
+    imgpaths : list of str-like
+        Paths to the images to print, in order (see ``prepare_img``).
+    commandport_id : str or int, optional
+        Serial device name or port number of the MM12 serial command port,
+        not needed for a dry run.
+    planner : str, optional
+        Key of ``PLANNERS`` (default is ``'print_image_better_better'``).
+    invert : boolean, optional
+        Invert the images (default is ``False``).
+    dry_run : boolean, optional
+        If ``True`` the toolpaths are planned and simulated but nothing is
+        sent to printerm (default is ``False``).  The ``finished`` event
+        carries the comparison with the image (see ``render_toolpath``).
+    confirm : boolean, optional
+        Wait for confirmation before any translation (default is ``False``).
+    events : file-like, optional
+        Where to write the progress events (default is ``sys.stdout``).
+    preview : str-like, optional
+        Path of a PNG file updated with the pixels printed so far (default is
+        ``None``, no preview).
+    render : str-like, optional
+        On a dry run, directory where the simulated result of each image is
+        rendered as ``<image name>-dryrun.png`` (default is ``None``).
+    render_scale : int, optional
+        Scale of the rendered dry runs (default is 1).
+    overlap : boolean, optional
+        Overlap the :math:`Z` translations with the adjacent pixel
+        translations (default is ``False``, see ``overlap_z``).
+    previous : str-like, optional
+        Path to the image already printed on the sheets.  Only the pixels of
+        each image that are not in this one are printed (default is
+        ``None``, see ``plan_delta``).
+    cache : ToolpathCache, optional
+        Jobs found in the cache are printed without preparing and planning
+        them, and the jobs planned are added to it.  Dry runs are always
+        planned (default is ``None``, no cache).
+    nest : dict, optional
+        Pack all the images onto one sheet, printed as a single job, with the
+        keyword arguments of ``nest_images`` (*copies*, *sheet_width* and
+        *gap*).  The ``planned`` event carries the placements, the sheet
+        utilization and the modeled time against printing the copies one by
+        one (see ``toolpath_seconds``).  Nested jobs are not cached (default
+        is ``None``, one job per image).
 
-            if y == b - 1:
-                translate('Z-')
-                break
-            translate('Y+P', confirm)
-            y += 1
-
-            # To the left.
-            print 'Printing across the row {0}'.format(y)
-            while True:
-                report_position(x, y)
-                if img[y][x] == 0.0:
-                    translate('Z+', confirm)
-                if img[y][x-1] != 0.0:
-                    translate('Z-', confirm)
-                if x == 0:
-                    translate('Z-')
-                    break
-                translate('X-P', confirm)
-                x -= 1
+    Returns
+    -------
+    status : int
+        One of the ``EXIT_*`` constants.
+    '''
+    if events is None:
+        events = sys.stdout
 
-            if y == b - 1:
-                translate('Z-')
-                break
-            translate('Y+P', confirm)
-            y += 1
+    if not dry_run:
+        try:
+            connect_printerm(commandport_id)
+        except serial.SerialException as e:
+            emit_event(events, 'error', message=str(e))
+            return EXIT_NO_CONNECTION
+
+    previous_img = None
+    for job, imgpath in enumerate(imgpaths if nest is None else [imgpaths]):
+        start = time.time()
+        entry = key = None
+        try:
+            if cache is not None and nest is None:
+                key = cache.key(imgpath, invert, planner, overlap, previous)
+                if not dry_run:
+                    entry = cache.get(key)
+            cached = entry is not None
+            if not cached:
+                if nest is None:
+                    prepare_img(imgpath, invert)
+                else:
+                    imgs, placements, utilization = prepare_nested(
+                        imgpath, invert=invert, **nest)
+                entry = {'shape' : list(img.shape)}
+                target = img
+                if nest is not None:
+                    toolpath, entry['nest'] = plan_nested(
+                        img, imgs, nest.get('copies'), placements,
+                        utilization, PLANNERS[planner])
+                elif previous is None:
+                    toolpath = PLANNERS[planner](img)
+                else:
+                    if previous_img is None:
+                        previous_img = load_img(previous, invert)
+                    toolpath, target, regions = plan_delta(previous_img, img,
+                                                           PLANNERS[planner])
+                    entry['regions'] = [map(int, region)
+                                        for region in regions]
+                if overlap:
+                    toolpath = overlap_z(toolpath)
+                entry['toolpath'] = toolpath
+                if key is not None:
+                    cache.put(key, entry)
+        except (IOError, ValueError) as e:
+            emit_event(events, 'error', job=job, image=imgpath,
+                       message=str(e))
+            return EXIT_FAILURE
+
+        toolpath = entry['toolpath']
+        shape = tuple(entry['shape'])
+        delta = {}
+        for name in ('regions', 'nest'):
+            if name in entry:
+                delta[name] = entry[name]
+        emit_event(events, 'planned', job=job, image=imgpath, rows=shape[0],
+                   columns=shape[1], planner=planner, commands=len(toolpath),
+                   cached=cached, **delta)
+
+        if dry_run:
+            counts = {}
+            for adm in toolpath:
+                counts[adm] = counts.get(adm, 0) + 1
+            fpath = None
+            if render is not None:
+                name = 'nest' if nest is not None else \
+                    os.path.splitext(os.path.basename(imgpath))[0]
+                fpath = os.path.join(render, '{0}-dryrun.png'.format(name))
+            report = render_toolpath(toolpath, target, fpath, render_scale)
+            emit_event(events, 'finished', job=job, image=imgpath,
+                       dry_run=True, counts=counts, render=fpath,
+                       elapsed=time.time() - start, **report)
+            continue
+
+        def report_progress(progress):
+            emit_event(events, 'progress', job=job, done=progress.done,
+                       total=progress.total, row=progress.y,
+                       column=progress.x, rate=progress.rate(),
+                       eta=progress.eta())
+
+        with Progress(len(toolpath), shape, preview,
+                      render=report_progress) as progress:
+            completed = print_toolpath(toolpath, confirm, progress.update)
+        if not completed:
+            emit_event(events, 'interrupted', job=job, image=imgpath,
+                       elapsed=time.time() - start)
+            return EXIT_INTERRUPTED
+
+        print >>logf, 'Printed ``{0}``'.format(imgpath)
+        emit_event(events, 'finished', job=job, image=imgpath,
+                   commands=len(toolpath), elapsed=time.time() - start)
+
+    return EXIT_OK
+
+class PrintJob(object):
+    '''A job in the ``PrintDaemon`` queue.
 
-        print 'Returning to a_{{0, 0}}'.format(y)
+    Parameters
+    ----------
+    jobid : int
+        Job identifier, unique within the daemon.
+    imgpath : str-like
+        Path to the image file (see ``load_img``).
+    invert : boolean
+        Invert the image.
+    planner : str
+        Key of ``PLANNERS``.
+    priority : int
+        Jobs with higher priority are printed first, jobs with equal priority
+        are printed in order of submission.
+    overlap : boolean
+        Overlap the :math:`Z` translations with the adjacent pixel
+        translations (see ``overlap_z``).
+    '''
+    def __init__(self, jobid, imgpath, invert, planner, priority, overlap):
+        self.id = jobid
+        self.imgpath = imgpath
+        self.invert = invert
+        self.planner = planner
+        self.priority = priority
+        self.overlap = overlap
+        self.state = 'queued'
+        self.error = None
+        self.toolpath = None
+        self.done = 0
+        self.submitted = time.time()
+        self.started = self.finished = None
+
+    def sort_key(self):
+        return (-self.priority, self.id)
+
+    def as_dict(self):
+        '''Summary of the job suitable for JSON serialization.'''
+        return {
+            'id'        : self.id,
+            'image'     : self.imgpath,
+            'invert'    : self.invert,
+            'planner'   : self.planner,
+            'priority'  : self.priority,
+            'overlap'   : self.overlap,
+            'state'     : self.state,
+            'error'     : self.error,
+            'commands'  : None if self.toolpath is None else len(self.toolpath),
+            'done'      : self.done,
+            'submitted' : self.submitted,
+            'started'   : self.started,
+            'finished'  : self.finished,
+        }
+
+class PrintDaemon(object):
+    '''Long running print server that owns the connection with printerm.
+
+    Jobs are kept in a priority queue.  A preparation thread loads and plans
+    up to *prepare_ahead* jobs in advance while the printing thread drives
+    printerm, so consecutive jobs are printed without idle time in between.
+    printerc must already be connected with printerm (see
+    ``connect_printerm``) and the tool must be at the HOME position.
+
+    Parameters
+    ----------
+    prepare_ahead : int, optional
+        Maximum number of prepared jobs waiting to be printed (default is 2).
+    cache : ToolpathCache, optional
+        Where the toolpaths of the jobs are looked up before planning them
+        (default is ``None``, no cache).
+    '''
+    def __init__(self, prepare_ahead=2, cache=None):
+        self.prepare_ahead = prepare_ahead
+        self.cache = cache
+        self.cond = threading.Condition()
+        self.queued = []    # heap of jobs waiting to be prepared.
+        self.ready = []     # heap of jobs waiting to be printed.
+        self.jobs = {}
+        self.current = None
+        self.next_id = 0
+        self.started = time.time()
+        self.busy_seconds = 0.0
+        self.commands_sent = 0
+        self.njobs = {'done' : 0, 'failed' : 0, 'cancelled' : 0}
+
+        for target in (self._prepare_loop, self._print_loop):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+
+    def submit(self, imgpath, invert=False, planner='print_image_better_better',
+               priority=0, overlap=False):
+        '''Add a job to the queue.
+
+        Returns
+        -------
+        job : PrintJob
+        '''
+        if planner not in PLANNERS:
+            raise ValueError('unknown planner ``{0}``'.format(planner))
+        with self.cond:
+            job = PrintJob(self.next_id, imgpath, invert, planner, priority,
+                           overlap)
+            self.next_id += 1
+            self.jobs[job.id] = job
+            heapq.heappush(self.queued, (job.sort_key(), job))
+            self.cond.notify_all()
+        print >>logf, 'Job {0} queued: ``{1}``'.format(job.id, imgpath)
+        return job
+
+    def cancel(self, jobid):
+        '''Cancel a job that has not started printing.
+
+        Returns
+        -------
+        cancelled : boolean
+            ``False`` if the job is printing or already finished.
+        '''
+        with self.cond:
+            job = self.jobs[jobid]
+            if job.state not in ('queued', 'preparing', 'ready'):
+                return False
+            job.state = 'cancelled'
+            job.toolpath = None
+            self.njobs['cancelled'] += 1
+            self.cond.notify_all()
+        return True
+
+    def status(self):
+        '''Queue contents and throughput metrics.
+
+        Returns
+        -------
+        status : dict
+        '''
+        with self.cond:
+            uptime = time.time() - self.started
+            busy = self.busy_seconds
+            if self.current is not None:
+                busy += time.time() - self.current.started
+            return {
+                'uptime'            : uptime,
+                'busy_seconds'      : busy,
+                'utilization'       : busy / uptime if uptime else 0.0,
+                'commands_sent'     : self.commands_sent,
+                'commands_per_second' :
+                    self.commands_sent / busy if busy else 0.0,
+                'jobs_per_hour'     :
+                    3600 * self.njobs['done'] / uptime if uptime else 0.0,
+                'jobs'              : dict(self.njobs),
+                'queued'            : [j.id for k, j in sorted(self.queued)
+                                       if j.state == 'queued'],
+                'ready'             : [j.id for k, j in sorted(self.ready)
+                                       if j.state == 'ready'],
+                'current'           : None if self.current is None
+                                      else self.current.as_dict(),
+                'cache'             : None if self.cache is None
+                                      else self.cache.info(),
+            }
+
+    def _pop(self, heap, state):
+        # Discard cancelled jobs on the top of the heap.
+        while heap and heap[0][1].state != state:
+            heapq.heappop(heap)
+        if heap:
+            return heapq.heappop(heap)[1]
+
+    def _prepare_loop(self):
         while True:
-            if y == 0:
-                break
-            translate('Y-P', confirm)
-            y -= 1
+            with self.cond:
+                while True:
+                    nready = len([1 for k, j in self.ready if j.state == 'ready'])
+                    if nready < self.prepare_ahead:
+                        job = self._pop(self.queued, 'queued')
+                        if job is not None:
+                            break
+                    self.cond.wait()
+                job.state = 'preparing'
+
+            try:
+                key = toolpath = None
+                if self.cache is not None:
+                    key = self.cache.key(job.imgpath, job.invert, job.planner,
+                                         job.overlap)
+                    entry = self.cache.get(key)
+                    if entry is not None:
+                        toolpath = entry['toolpath']
+                if toolpath is None:
+                    jobimg = load_img(job.imgpath, job.invert)
+                    toolpath = PLANNERS[job.planner](jobimg)
+                    if job.overlap:
+                        toolpath = overlap_z(toolpath)
+                    if key is not None:
+                        self.cache.put(key, {'shape' : list(jobimg.shape),
+                                             'toolpath' : toolpath})
+            except (IOError, ValueError) as e:
+                with self.cond:
+                    job.state, job.error = 'failed', str(e)
+                    job.finished = time.time()
+                    self.njobs['failed'] += 1
+                print >>logf, 'Job {0} failed: {1}'.format(job.id, e)
+                continue
+
+            with self.cond:
+                if job.state == 'preparing':
+                    job.toolpath, job.state = toolpath, 'ready'
+                    heapq.heappush(self.ready, (job.sort_key(), job))
+                    self.cond.notify_all()
+
+    def _print_loop(self):
+        def count(i, adm, x, y):
+            job.done = i + 1
+            self.commands_sent += 1
+
         while True:
-            if x == 0:
+            with self.cond:
+                job = self._pop(self.ready, 'ready')
+                while job is None:
+                    self.cond.wait()
+                    job = self._pop(self.ready, 'ready')
+                job.state, job.started = 'printing', time.time()
+                self.current = job
+                self.cond.notify_all()
+
+            print >>logf, 'Job {0} printing: ``{1}``'.format(job.id,
+                                                            job.imgpath)
+            try:
+                print_toolpath(job.toolpath, report=count)
+                state, error = 'done', None
+            except Exception as e:
+                state, error = 'failed', str(e)
+            print >>logf, 'Job {0} {1}'.format(job.id, state)
+
+            with self.cond:
+                job.state, job.error = state, error
+                job.finished = time.time()
+                job.toolpath = None
+                self.busy_seconds += job.finished - job.started
+                self.njobs[state] += 1
+                self.current = None
+
+    def serve_forever(self, address=None):
+        '''Serve the HTTP API until interrupted.
+
+        ============ ============== ============================================
+        method       path           action
+        ============ ============== ============================================
+        ``POST``     ``/jobs``      submit a job, the body is a JSON object
+                                    with the members ``image`` and optionally
+                                    ``invert``, ``planner``, ``priority`` and
+                                    ``overlap``.
+        ``GET``      ``/jobs``      list the jobs.
+        ``GET``      ``/jobs/<id>`` describe a job.
+        ``DELETE``   ``/jobs/<id>`` cancel a job that has not started printing.
+        ``GET``      ``/status``    queue and throughput metrics.
+        ============ ============== ============================================
+
+        Parameters
+        ----------
+        address : tuple, optional
+            ``(host, port)`` to listen on (default is ``DAEMON_ADDRESS``).
+        '''
+        import BaseHTTPServer
+
+        printdaemon = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def reply(self, code, obj):
+                body = json.dumps(obj, sort_keys=True)
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def job_id(self):
+                try:
+                    jobid = int(self.path.split('/')[2])
+                except (IndexError, ValueError):
+                    return None
+                if jobid in printdaemon.jobs:
+                    return jobid
+
+            def do_GET(self):
+                if self.path == '/status':
+                    self.reply(200, printdaemon.status())
+                elif self.path == '/jobs':
+                    with printdaemon.cond:
+                        jobs = [printdaemon.jobs[k].as_dict()
+                                for k in sorted(printdaemon.jobs)]
+                    self.reply(200, jobs)
+                elif self.path.startswith('/jobs/') and self.job_id() is not None:
+                    self.reply(200, printdaemon.jobs[self.job_id()].as_dict())
+                else:
+                    self.reply(404, {'error' : 'not found'})
+
+            def do_POST(self):
+                if self.path != '/jobs':
+                    self.reply(404, {'error' : 'not found'})
+                    return
+                try:
+                    length = int(self.headers.getheader('Content-Length', 0))
+                    request = json.loads(self.rfile.read(length))
+                    job = printdaemon.submit(request['image'],
+                        bool(request.get('invert', False)),
+                        request.get('planner', 'print_image_better_better'),
+                        int(request.get('priority', 0)),
+                        bool(request.get('overlap', False)))
+                except KeyError as e:
+                    self.reply(400, {'error' : 'missing member {0}'.format(e)})
+                    return
+                except (ValueError, TypeError) as e:
+                    self.reply(400, {'error' : str(e)})
+                    return
+                self.reply(201, job.as_dict())
+
+            def do_DELETE(self):
+                jobid = self.job_id()
+                if not self.path.startswith('/jobs/') or jobid is None:
+                    self.reply(404, {'error' : 'not found'})
+                elif printdaemon.cancel(jobid):
+                    self.reply(200, printdaemon.jobs[jobid].as_dict())
+                else:
+                    self.reply(409, {'error' : 'job can not be cancelled'})
+
+            def log_message(self, format, *args):
+                print >>logf, format % args
+
+        if address is None:
+            address = DAEMON_ADDRESS
+        server = BaseHTTPServer.HTTPServer(address, Handler)
+        msg = '``{0}`` serving print jobs on http://{1}:{2}'.format(
+            PN, *server.server_address)
+        for f in (logf, sys.stdout):
+            print >>f, msg
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print 'Print daemon stopped'
+        finally:
+            server.server_close()
+
+def daemon_request(method, path, obj=None, address=None):
+    '''Send a request to a running ``PrintDaemon``.
+
+    Parameters
+    ----------
+    method : str
+        HTTP method.
+    path : str
+        Resource path (see ``PrintDaemon.serve_forever``).
+    obj : optional
+        JSON serializable request body.
+    address : tuple, optional
+        ``(host, port)`` of the daemon (default is ``DAEMON_ADDRESS``).
+
+    Returns
+    -------
+    response
+        The decoded JSON response.
+    '''
+    import urllib2
+
+    if address is None:
+        address = DAEMON_ADDRESS
+    url = 'http://{0}:{1}{2}'.format(address[0], address[1], path)
+    data = None if obj is None else json.dumps(obj)
+    request = urllib2.Request(url, data, {'Content-Type' : 'application/json'})
+    request.get_method = lambda: method
+    try:
+        response = urllib2.urlopen(request)
+    except urllib2.HTTPError as e:
+        response = e
+    return json.loads(response.read())
+
+def benchmark_startup(repeat=3):
+    '''Measure and report the import time of printerc and its dependencies.
+
+    Every module is imported in a fresh interpreter, so the timings are not
+    affected by modules already loaded in this process.
+
+    Parameters
+    ----------
+    repeat : int, optional
+        Number of fresh interpreters launched per module, the best time is
+        reported (default is 3).
+
+    Returns
+    -------
+    timings : dict
+        Maps each module name in ``STARTUP_BENCHMARK_MODULES`` to its best
+        import time in seconds, or ``None`` if it could not be imported.
+    '''
+    code = ('import time; t0 = time.time(); import {0}; '
+            'import sys; sys.stdout.write(repr(time.time() - t0))')
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [os.path.dirname(os.path.abspath(__file__)),
+         env.get('PYTHONPATH', '')])
+
+    timings = {}
+    for module in STARTUP_BENCHMARK_MODULES:
+        best = None
+        for i in range(repeat):
+            child = subprocess.Popen([sys.executable, '-c', code.format(module)],
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE, env=env)
+            out, err = child.communicate()
+            if child.returncode != 0:
                 break
-            translate('X-P', confirm)
-            x -= 1
+            elapsed = float(out)
+            if best is None or elapsed < best:
+                best = elapsed
+        timings[module] = best
+
+    print 'Import time (best of {0}):'.format(repeat)
+    for module in STARTUP_BENCHMARK_MODULES:
+        if timings[module] is None:
+            print '  {0:<20} not available'.format(module)
+        else:
+            print '  {0:<20} {1:8.1f} ms'.format(module, timings[module] * 1000)
+    return timings
+
+def parse_address(address):
+    '''Parse a ``HOST:PORT`` string into a ``(host, port)`` tuple.'''
+    host, sep, port = address.rpartition(':')
+    try:
+        return (host or DAEMON_ADDRESS[0], int(port))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'invalid address ``{0}``'.format(address))
 
-        print 'The image has been printed'
+def parse_listen_address(address):
+    '''Parse the ``HOST:PORT`` the print daemon listens on, see
+    ``parse_address``.
 
-    except KeyboardInterrupt:
-        sp.flush()
-        print 'Operation interrupted, flushing command port'
+    The daemon API is not authenticated and takes paths of the local file
+    system, so *HOST* must be a loopback address.
+    '''
+    host, port = parse_address(address)
+    try:
+        loopback = socket.gethostbyname(host).startswith('127.')
+    except socket.error:
+        loopback = False
+    if not loopback:
+        raise argparse.ArgumentTypeError(
+            '``{0}`` is not a loopback address, the daemon only accepts '
+            'local connections'.format(host))
+    return host, port
+
+def open_cache(args):
+    '''``ToolpathCache`` selected by the ``--cache-dir``, ``--cache-size`` and
+    ``--no-cache`` options, ``None`` if disabled or not available.'''
+    if args.no_cache:
+        return None
+    try:
+        return ToolpathCache(args.cache_dir, args.cache_size * 2**20)
+    except OSError as e:
+        print >>sys.stderr, 'Toolpath cache disabled: {0}'.format(e)
+
+def main(argv=None):
+    '''Entry point of the printerc command line interface.
+
+    Without arguments (or with the ``shell`` command) the interactive IPython
+    shell is launched, any other command runs non-interactively and returns an
+    exit status.
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        Command line arguments, without the program name (default is
+        ``sys.argv[1:]``).
+    '''
+    global PN, logf, MACHINE
+
+    if argv is None:
+        argv = sys.argv[1:]
+    if not argv:
+        argv = ['shell']
+
+    parser = argparse.ArgumentParser(prog='printerc',
+                                     description='printer73x numerical control')
+    parser.add_argument('--version', action='version', version=__version__)
+    parser.add_argument('--machine', default=MACHINE,
+                        help='name of the tuned machine profile to use')
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('shell', help='launch the interactive shell')
+    run_parser = commands.add_parser('run', help='print images non-interactively')
+    run_parser.add_argument('images', nargs='+', metavar='image',
+                            help='PNG image to print, jobs run in order')
+    run_parser.add_argument('--port', help='MM12 command port')
+    run_parser.add_argument('--planner', choices=sorted(PLANNERS),
+                            default='print_image_better_better')
+    run_parser.add_argument('--invert', action='store_true')
+    run_parser.add_argument('--overlap-z', action='store_true',
+                            help='overlap Z and XY translations')
+    run_parser.add_argument('--previous', metavar='PNG',
+                            help='print only the pixels not in PNG, '
+                                 'already printed on the sheets')
+    run_parser.add_argument('--nest', action='store_true',
+                            help='pack the images onto one sheet')
+    run_parser.add_argument('--copies', type=int, nargs='+', metavar='N',
+                            help='copies of each image, with --nest')
+    run_parser.add_argument('--sheet-width', type=int, metavar='PIXELS')
+    run_parser.add_argument('--gap', type=int, default=1, metavar='PIXELS',
+                            help='blank pixels between nested images')
+    run_parser.add_argument('--dry-run', action='store_true',
+                            help='plan the jobs without driving printerm')
+    run_parser.add_argument('--confirm', action='store_true',
+                            help='confirm every translation with Enter')
+    run_parser.add_argument('--preview', metavar='PNG',
+                            help='keep PNG updated with the printed pixels')
+    run_parser.add_argument('--render', metavar='DIR',
+                            help='render the dry runs as PNG files in DIR')
+    run_parser.add_argument('--render-scale', type=int, default=1,
+                            metavar='N')
+    daemon_parser = commands.add_parser('daemon',
+                                        help='serve a print job queue')
+    daemon_parser.add_argument('--port', required=True,
+                               help='MM12 command port')
+    daemon_parser.add_argument('--listen', type=parse_listen_address,
+                               default=DAEMON_ADDRESS, metavar='HOST:PORT')
+    cache_parser = commands.add_parser('cache',
+                                       help='show the toolpath cache statistics')
+    cache_parser.add_argument('--clear', action='store_true',
+                              help='remove every cached toolpath')
+    for subparser in (run_parser, daemon_parser, cache_parser):
+        subparser.add_argument('--cache-dir', default=TOOLPATH_CACHE_DIR,
+                               metavar='DIR')
+        subparser.add_argument('--cache-size', type=int, metavar='MB',
+                               default=TOOLPATH_CACHE_SIZE // 2**20)
+        subparser.add_argument('--no-cache', action='store_true',
+                               help=argparse.SUPPRESS
+                               if subparser is cache_parser else
+                               'plan every job from scratch')
+    submit_parser = commands.add_parser('submit',
+                                        help='submit a job to the daemon')
+    submit_parser.add_argument('image')
+    submit_parser.add_argument('--planner', choices=sorted(PLANNERS),
+                               default='print_image_better_better')
+    submit_parser.add_argument('--invert', action='store_true')
+    submit_parser.add_argument('--priority', type=int, default=0)
+    submit_parser.add_argument('--overlap-z', action='store_true')
+    status_parser = commands.add_parser('status', help='query the daemon')
+    for subparser in (submit_parser, status_parser):
+        subparser.add_argument('--daemon', type=parse_address,
+                               default=DAEMON_ADDRESS, metavar='HOST:PORT')
+    benchz_parser = commands.add_parser('benchmark-z',
+        help='compare Z timings on the MM12 emulator')
+    for name in ('settle', 'speed', 'acceleration'):
+        benchz_parser.add_argument('--' + name, type=int, nargs=2,
+                                   metavar=('DOWN', 'UP'))
+    benchz_parser.add_argument('--toggles', type=int, default=1000)
+    tune_parser = commands.add_parser('tune',
+        help='find the fastest safe MM12 script settings')
+    tune_parser.add_argument('--port', required=True,
+                             help='MM12 command port')
+    tune_parser.add_argument('--distance', type=int, default=20,
+                             help='pixels of the lost steps test trips')
+    tune_parser.add_argument('--repeat', type=int, default=3)
+    script_parser = commands.add_parser('build-script',
+        help='generate and check the MM12 script')
+    script_parser.add_argument('path')
+    script_parser.add_argument('--delay', type=int,
+                               help='ms between transitions')
+    script_parser.add_argument('--unroll', type=int, metavar='N',
+                               help='transitions per loop iteration, '
+                                    'timed without delay')
+    script_parser.add_argument('--busy-wait', type=int, metavar='N',
+                               help='instruction pairs after every edge')
+    bench_parser = commands.add_parser('benchmark-startup',
+                                       help='measure module import time')
+    bench_parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+    if args.command == 'run' and not (args.port or args.dry_run):
+        parser.error('run: --port is required unless --dry-run is given')
+    if args.command == 'run' and args.render and not args.dry_run:
+        parser.error('run: --render requires --dry-run')
+    if args.command == 'run' and args.nest and args.previous:
+        parser.error('run: --nest and --previous are exclusive')
+    if args.command == 'run' and args.copies and (
+            not args.nest or len(args.copies) != len(args.images)):
+        parser.error('run: --copies requires --nest and a count per image')
 
-if __name__ == "__main__":
     # program name from file name.
     PN = os.path.splitext(sys.argv[0])[0]
 
     logf = open(LOGF, 'w')
     print >>logf, 'START'
     atexit.register(on_exit)
+
+    MACHINE = args.machine
+    profile = load_machine_profile(MACHINE)
+    if profile is not None:
+        MM12_PROFILE.update(profile.get('script', {}))
+        for adm, timing in profile.get('z_timing', {}).items():
+            Z_TIMING[adm].update(timing)
+        print >>logf, 'Using the profile of ``{0}`` tuned {1}'.format(
+            MACHINE, profile['tuned'])
+
+    if args.command == 'run':
+        # Keep stdout for the progress events only.
+        events, sys.stdout = sys.stdout, sys.stderr
+        port = args.port
+        if port is not None and port.isdigit():
+            port = int(port)
+        return run_jobs(args.images, port, args.planner, args.invert,
+                        args.dry_run, args.confirm, events, args.preview,
+                        args.render, args.render_scale, args.overlap_z,
+                        args.previous, open_cache(args),
+                        {'copies'      : args.copies,
+                         'sheet_width' : args.sheet_width,
+                         'gap'         : args.gap} if args.nest else None)
+
+    if args.command in ('submit', 'status'):
+        try:
+            if args.command == 'submit':
+                response = daemon_request('POST', '/jobs', {
+                    'image'    : os.path.abspath(args.image),
+                    'invert'   : args.invert,
+                    'planner'  : args.planner,
+                    'priority' : args.priority,
+                    'overlap'  : args.overlap_z,
+                }, args.daemon)
+            else:
+                response = daemon_request('GET', '/status', None, args.daemon)
+        except IOError as e:
+            print >>sys.stderr, 'Print daemon not available: {0}'.format(e)
+            return EXIT_NO_CONNECTION
+        print json.dumps(response, indent=2, sort_keys=True)
+        return EXIT_FAILURE if 'error' in response else EXIT_OK
+
+    if args.command == 'daemon':
+        port = int(args.port) if args.port.isdigit() else args.port
+        try:
+            connect_printerm(port)
+        except serial.SerialException as e:
+            print >>sys.stderr, e
+            return EXIT_NO_CONNECTION
+        PrintDaemon(cache=open_cache(args)).serve_forever(args.listen)
+        return EXIT_OK
+
+    if args.command == 'cache':
+        cache = open_cache(args)
+        if cache is None:
+            return EXIT_FAILURE
+        if args.clear:
+            cache.clear()
+        print json.dumps(cache.info(), indent=2, sort_keys=True)
+        return EXIT_OK
+
+    if args.command == 'benchmark-z':
+        z_timing = dict((adm, dict(timing)) for adm, timing in Z_TIMING.items())
+        for name in ('settle', 'speed', 'acceleration'):
+            if getattr(args, name) is not None:
+                for adm, value in zip(('Z+', 'Z-'), getattr(args, name)):
+                    z_timing[adm][name] = value
+        benchmark_z_timing(z_timing, args.toggles)
+        return EXIT_OK
+
+    if args.command == 'tune':
+        port = int(args.port) if args.port.isdigit() else args.port
+        try:
+            connect_printerm(port)
+        except serial.SerialException as e:
+            print >>sys.stderr, e
+            return EXIT_NO_CONNECTION
+        profile = tune_feed_rate(MACHINE, args.distance, args.repeat)
+        return EXIT_FAILURE if profile is None else EXIT_OK
+
+    if args.command == 'build-script':
+        # The options override the machine profile.
+        settings = dict(MM12_PROFILE)
+        for key in ('delay', 'unroll', 'busy_wait'):
+            if getattr(args, key) is not None:
+                settings[key] = getattr(args, key)
+        try:
+            report = build_mm12_script(args.path, **settings)
+        except ValueError as e:
+            print >>sys.stderr, e
+            return EXIT_FAILURE
+        print 'Script of about {0} of {1} bytes written to ``{2}``'.format(
+            report['bytes'], MM12_SCRIPT_MEMORY, args.path)
+        for adm, rate in sorted(report['rates'].items()):
+            print '  {0:<6} {1:8.1f} transitions/s'.format(adm, rate)
+        for warning in report['warnings']:
+            print >>sys.stderr, 'Warning: {0}'.format(warning)
+        return EXIT_OK
+
+    if args.command == 'benchmark-startup':
+        benchmark_startup(args.repeat)
+        return 0
+
+    import IPython
     IPython.Shell.IPShellEmbed()( INTRO_MSG)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())